@@ -7,9 +7,95 @@ import pandas as pd
 import logging
 import subprocess as sp
 import shlex
+import multiprocessing
+import numpy as np
 from utils import setup_logger
+from SamtoolsStats import SamtoolsStats
 #from resources import *
 
+MAX_INSERT_SIZE = 8000  # samtools stats -i default
+MAX_COVERAGE = 1000     # depths above this go to the last COV bin, as in samtools stats
+REGION_SIZE = 10000000
+# SAM flag bits
+PAIRED, PROPER_PAIR, UNMAPPED, MATE_UNMAPPED, REVERSE, MATE_REVERSE = 0x1, 0x2, 0x4, 0x8, 0x10, 0x20
+SECONDARY, QCFAIL, DUPLICATE, SUPPLEMENTARY = 0x100, 0x200, 0x400, 0x800
+
+def _region_stats(task):
+    """ Worker: accumulates counts and histograms for the reads starting in one region.
+    Coverage is counted from the aligned blocks of every primary or supplementary read overlapping the
+    region (QC failed and duplicate reads included, as samtools stats does), clipped to it.
+    The contig '*' stands for the unplaced reads at the end of the file.
+    """
+    path, contig, start, end, threads = task
+    flags, mapqs, tlens, lengths = [], [], [], []
+    depth_diff = np.zeros(end - start + 1, dtype=np.int64)
+    with pysam.AlignmentFile(path, 'rb', threads=threads, check_sq=False) as samfile:
+        reads = samfile.fetch('*') if contig == '*' else samfile.fetch(contig, start, end)
+        for read in reads:
+            flag = read.flag
+            if not flag & (UNMAPPED | SECONDARY):
+                for block_start, block_end in read.get_blocks():
+                    block_start, block_end = max(block_start, start), min(block_end, end)
+                    if block_start < block_end:
+                        depth_diff[block_start - start] += 1
+                        depth_diff[block_end - start] -= 1
+            if contig != '*' and read.reference_start < start:
+                continue
+            flags.append(flag)
+            mapqs.append(read.mapping_quality)
+            tlens.append(read.template_length)
+            lengths.append(read.query_length)
+    return _summarize_reads(np.array(flags, dtype=np.int64), np.array(mapqs, dtype=np.int64),
+                            np.array(tlens, dtype=np.int64), np.array(lengths, dtype=np.int64),
+                            np.cumsum(depth_diff[:-1]))
+
+def _summarize_reads(flags, mapqs, tlens, lengths, depth):
+    """ Vectorized counts and histograms over the flag/MAPQ/TLEN/length arrays of a set of reads """
+    primary = (flags & (SECONDARY | SUPPLEMENTARY)) == 0
+    mapped = primary & ((flags & UNMAPPED) == 0)
+    paired = primary & ((flags & PAIRED) != 0)
+    both_mapped = paired & mapped & ((flags & MATE_UNMAPPED) == 0)
+    counts = {
+        'raw_total_sequences': int(primary.sum()),
+        'reads_mapped': int(mapped.sum()),
+        'reads_mapped_and_paired': int(both_mapped.sum()),
+        'reads_unmapped': int((primary & ~mapped).sum()),
+        'reads_properly_paired': int((paired & ((flags & PROPER_PAIR) != 0)).sum()),
+        'reads_paired': int(paired.sum()),
+        'reads_duplicated': int((primary & ((flags & DUPLICATE) != 0)).sum()),
+        'reads_mq0': int((mapped & (mapqs == 0)).sum()),
+        'reads_qc_failed': int((primary & ((flags & QCFAIL) != 0)).sum()),
+        'non_primary_alignments': int(((flags & SECONDARY) != 0).sum()),
+        'supplementary_alignments': int(((flags & SUPPLEMENTARY) != 0).sum()),
+        'total_length': int(lengths[primary].sum()),
+        'bases_mapped': int(lengths[mapped].sum()),
+        'maximum_length': int(lengths[primary].max()) if primary.any() else 0,
+    }
+    # Each pair counted once, from its leftmost read
+    leftmost = both_mapped & (tlens > 0) & (tlens <= MAX_INSERT_SIZE)
+    forward, mate_forward = (flags & REVERSE) == 0, (flags & MATE_REVERSE) == 0
+    inward = forward & ~mate_forward
+    outward = ~forward & mate_forward
+    insert_sizes = np.stack([np.bincount(tlens[leftmost & orientation], minlength=MAX_INSERT_SIZE + 1)
+                             for orientation in (np.ones_like(leftmost), inward, outward, ~(inward | outward))], axis=1)
+    usable = mapped & ((flags & (QCFAIL | DUPLICATE)) == 0)
+    histograms = {
+        'IS': insert_sizes,
+        'COV': np.bincount(np.minimum(depth, MAX_COVERAGE), minlength=MAX_COVERAGE + 1),
+        'RL': np.bincount(lengths[primary]) if primary.any() else np.zeros(1, dtype=np.int64),
+        'MAPQ': np.bincount(mapqs[usable], minlength=256),
+    }
+    return counts, histograms
+
+def _merge_histogram(total, part):
+    if total is None:
+        return part
+    if part.shape[0] > total.shape[0]:
+        total, part = part, total
+    total = total.copy()
+    total[:part.shape[0]] += part
+    return total
+
 class BAM(object):
     classname = __qualname__
     def __init__(self, bam_path, verbose=False):
@@ -35,13 +121,79 @@ class BAM(object):
                 self.logger.info("No reads found")
         return reads
     
-    def generate_stats(self, bam, SAMTOOLS=''):
-        ## TODO: Implement this
-        #self.logger.info("Generating stats for {b}".format(b=bam))
-        command = '{samtools} stats {bam}'
-        return command
-        
-        
+    def generate_stats(self, bam=None, output=None, threads=1, workers=1, region_size=REGION_SIZE):
+        """ Computes samtools stats summary numbers in process: read/pair counts, insert size,
+        coverage, read length and MAPQ histograms. The BAM is split into regions that are read on a
+        pool of workers, each decompressing BGZF with its own threads, and the per-region NumPy
+        histograms are summed.
+
+        Arguments:
+            bam {String} -- Indexed BAM, defaults to this object's BAM
+            output {String} -- Also write the stats in the samtools stats text format to this path
+            threads {Int} -- BGZF decompression threads per worker
+            workers {Int} -- Worker processes
+            region_size {Int} -- Bases per region
+
+        Returns a SamtoolsStats object with the same summary keys and histogram layout as a parsed
+        samtools stats file. Unlike samtools the insert size histogram is not trimmed to its 99% bulk,
+        so the insert size average and deviation can differ slightly; FFQ/LFQ/GCD are not computed.
+        """
+        bam = bam or self.path
+        self.logger.info("Generating stats for {b}".format(b=bam))
+        with pysam.AlignmentFile(bam, 'rb', check_sq=False) as samfile:
+            tasks = [(bam, contig, start, min(start + region_size, length), threads)
+                     for contig, length in zip(samfile.references, samfile.lengths)
+                     for start in range(0, length, region_size)]
+            if samfile.nocoordinate:
+                tasks.append((bam, '*', 0, 0, threads))
+        if workers > 1:
+            with multiprocessing.Pool(workers) as pool:
+                results = pool.imap_unordered(_region_stats, tasks)
+                counts, histograms = self._merge_region_stats(results)
+        else:
+            counts, histograms = self._merge_region_stats(map(_region_stats, tasks))
+        stats = SamtoolsStats.from_parsed(*self._format_stats(counts, histograms), path=output)
+        if output:
+            stats.write(output)
+            self.logger.info("Stats written to {o}".format(o=output))
+        return stats
+
+    def _merge_region_stats(self, results):
+        # start from the all-zero stats of no reads, so a BAM without regions (or reads) still has every field
+        no_reads = np.zeros(0, dtype=np.int64)
+        counts, histograms = _summarize_reads(no_reads, no_reads, no_reads, no_reads, no_reads)
+        for region_counts, region_histograms in results:
+            for key, value in region_counts.items():
+                counts[key] = max(counts.get(key, 0), value) if key == 'maximum_length' else counts.get(key, 0) + value
+            for section, values in region_histograms.items():
+                histograms[section] = _merge_histogram(histograms.get(section), values)
+        return counts, histograms
+
+    def _format_stats(self, counts, histograms):
+        """ Derived SN fields and the histograms as (value, count) rows like samtools writes them """
+        summary = dict(counts)
+        summary['unmapped_reads'] = summary['reads_unmapped']
+        summary['average_length'] = round(summary['total_length'] / summary['raw_total_sequences']) if summary['raw_total_sequences'] else 0
+        insert_sizes = histograms['IS']
+        pairs = insert_sizes[:, 0].sum()
+        sizes = np.arange(insert_sizes.shape[0])
+        mean = (sizes * insert_sizes[:, 0]).sum() / pairs if pairs else 0.0
+        summary['insert_size_average'] = round(float(mean), 1)
+        summary['insert_size_standard_deviation'] = round(float(np.sqrt(((sizes - mean)**2 * insert_sizes[:, 0]).sum() / pairs)), 1) if pairs else 0.0
+        summary['inward_oriented_pairs'] = int(insert_sizes[:, 1].sum())
+        summary['outward_oriented_pairs'] = int(insert_sizes[:, 2].sum())
+        summary['pairs_with_other_orientation'] = int(insert_sizes[:, 3].sum())
+        rows = {}
+        nonzero = np.flatnonzero(insert_sizes[:, 0])
+        rows['IS'] = np.column_stack([nonzero, insert_sizes[nonzero]])
+        for section in ['COV', 'RL', 'MAPQ']:
+            values = histograms[section]
+            nonzero = np.flatnonzero(values)
+            if section == 'COV':
+                nonzero = nonzero[nonzero > 0]
+            rows[section] = np.column_stack([nonzero, values[nonzero]])
+        return summary, rows
+
     def get_pileup(self, sample_name_sitelist_bam_tuple):
         sample_name = sample_name_sitelist_bam_tuple[0]
         sample_sitelist = sample_name_sitelist_bam_tuple[1]
@@ -1,36 +1,257 @@
 import os
+import re
+import glob
 import json
+import logging
 import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from utils import setup_logger
+
+logger = logging.getLogger(__name__)
 
 class SamtoolsStats:
+    # Histogram sections kept by the parser and the field their numeric columns start at
+    # (COV rows carry a "[1-1]" style bin label before the numbers)
+    histogram_sections = {
+        'IS': 1,    # insert size, pairs total, inward, outward, other
+        'COV': 2,   # coverage, bases
+        'GCD': 1,   # GC, unique sequence percentiles, 10th, 25th, 50th, 75th, 90th depth percentiles
+        'RL': 1,    # read length, count
+        'FFQ': 1,   # cycle, counts per quality for first fragments
+        'LFQ': 1,   # cycle, counts per quality for last fragments
+        'MAPQ': 1,  # mapping quality, count
+    }
+    float_sections = {'GCD'}
+    # SN field names as samtools stats writes them, used by write() to restore the exact labels
+    sn_labels = ['raw total sequences', 'filtered sequences', 'sequences', 'is sorted', '1st fragments',
+                 'last fragments', 'reads mapped', 'reads mapped and paired', 'reads unmapped',
+                 'reads properly paired', 'reads paired', 'reads duplicated', 'reads MQ0', 'reads QC failed',
+                 'non-primary alignments', 'supplementary alignments', 'total length',
+                 'total first fragment length', 'total last fragment length', 'bases mapped',
+                 'bases mapped (cigar)', 'bases trimmed', 'bases duplicated', 'mismatches', 'error rate',
+                 'average length', 'average first fragment length', 'average last fragment length',
+                 'maximum length', 'maximum first fragment length', 'maximum last fragment length',
+                 'average quality', 'insert size average', 'insert size standard deviation',
+                 'inward oriented pairs', 'outward oriented pairs', 'pairs with other orientation',
+                 'pairs on different chromosomes', 'percentage of properly paired reads (%)']
+    # Older key names of the SN fields, kept so existing consumers keep working
+    sn_aliases = {'reads_unmapped': 'unmapped_reads'}
+
     def __init__(self, path, verbose=False):
         self.path = path
+        self.summary = None
+        self.histograms = None
 
     @staticmethod
-    def parse_samtools_stats(stats_file):
-        output_dict = {}
+    def sn_key(name):
+        """SN field name to summary key, e.g. 'reads mapped and paired:' -> 'reads_mapped_and_paired'"""
+        return re.sub(r'[^0-9A-Za-z]+', '_', name.rstrip(':')).strip('_').lower()
+
+    @staticmethod
+    def to_number(value):
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+    @classmethod
+    def parse_stats_lines(cls, lines, sections=None):
+        """Parses samtools stats output in a single pass, dispatching every line on its
+        first tab separated token.
+
+        Arguments:
+            lines {iterable} -- Lines of a samtools stats file
+
+        Keyword Arguments:
+            sections {list} -- Histogram sections to keep (default: {all of histogram_sections})
+
+        Returns:
+            tuple -- (summary, histograms): every SN field as a number keyed by sn_key, and a
+            NumPy array (one row per line) for each histogram section
+        """
+        sections = cls.histogram_sections if sections is None else {s: cls.histogram_sections[s] for s in sections}
+        summary = {}
+        rows = {section: [] for section in sections}
+        for line in lines:
+            fields = line.rstrip('\n').split('\t')
+            section = fields[0]
+            if section == 'SN':
+                key = cls.sn_key(fields[1])
+                summary[key] = cls.to_number(fields[2])
+                if key in cls.sn_aliases:
+                    summary[cls.sn_aliases[key]] = summary[key]
+            elif section in rows:
+                rows[section].append(fields[sections[section]:])
+        histograms = {}
+        for section, section_rows in rows.items():
+            dtype = float if section in cls.float_sections else np.int64
+            width = max(map(len, section_rows), default=0)
+            if not section_rows:
+                histograms[section] = np.zeros((0, 0), dtype=dtype)
+                continue
+            if any(len(row) != width for row in section_rows):
+                section_rows = [row + ['0']*(width-len(row)) for row in section_rows]
+            histograms[section] = np.array(section_rows, dtype=dtype)
+        return summary, histograms
+
+    @classmethod
+    def parse_samtools_stats_sections(cls, stats_file, sections=None):
+        """parse_stats_lines over a samtools stats file"""
         with open(stats_file) as cur_file:
-            for line in cur_file:
-                line = line.strip()
-                if "SN" in line:
-                    if "reads mapped:" in line:
-                        mapped_reads = line.split(":")[1].strip()
-                        output_dict['reads_mapped'] = mapped_reads
-                    elif "reads mapped and paired" in line:
-                        mapped_and_paired = line.split(":")[1].strip().split("\t")[0]
-                        output_dict['reads_mapped_and_paired'] = mapped_and_paired
-                    elif "reads unmapped" in line:
-                        unmapped_reads = line.split(":")[1].strip()
-                        output_dict['unmapped_reads'] = unmapped_reads
+            return cls.parse_stats_lines(cur_file, sections=sections)
+
+    @staticmethod
+    def parse_samtools_stats(stats_file):
+        output_dict, histograms = SamtoolsStats.parse_samtools_stats_sections(stats_file, sections=[])
         return output_dict
-    
+
+    def parse(self):
+        """Parses the stats file once and keeps the summary and histograms on the object"""
+        if self.summary is None:
+            self.summary, self.histograms = self.parse_samtools_stats_sections(self.path)
+        return self.summary, self.histograms
+
+    @classmethod
+    def from_parsed(cls, summary, histograms, path=None):
+        """SamtoolsStats object for numbers computed elsewhere (e.g. BAM.generate_stats)"""
+        stats = cls(path)
+        stats.summary, stats.histograms = summary, histograms
+        return stats
+
+    def write(self, path):
+        """Writes the summary and histograms in the samtools stats text format, SN fields under their
+        samtools labels, so the file can be read back with parse_samtools_stats or plotted with plot-bamstats"""
+        summary, histograms = self.parse()
+        labels = {self.sn_key(label): label for label in self.sn_labels}
+        with open(path, 'w') as out:
+            out.write("# Summary Numbers. Use `grep ^SN | cut -f 2-` to extract this part.\n")
+            for key, value in summary.items():
+                if key in self.sn_aliases.values():
+                    continue
+                out.write("SN\t{name}:\t{value}\n".format(name=labels.get(key, key.replace('_', ' ')), value=value))
+            for section, values in histograms.items():
+                for row in values.tolist():
+                    label = ["[{d}-{d}]".format(d=row[0])] if section == 'COV' else []
+                    out.write("\t".join([section] + label + [str(item) for item in row]) + "\n")
+
     def print_stats(self):
-        output_dict = self.parse_samtools_stats(self.path)
+        output_dict, histograms = self.parse()
         print(json.dumps(output_dict, indent=2))
 
+# Batch QC aggregation
+ID_COLUMNS = ['sample', 'path', 'mtime']
+
+def collect_stats_files(pattern=None, manifest=None):
+    """Lists the stats files to aggregate from a glob pattern and/or a manifest. Manifest lines are
+    either a path or a sample name and a path separated by a tab. Samples are named after the file
+    (without the .stats/.txt extension) unless the manifest names them.
+
+    Returns:
+        list -- (sample, path) tuples
+    """
+    stats_files = []
+    if pattern:
+        stats_files += [(None, path) for path in sorted(glob.glob(pattern))]
+    if manifest:
+        with open(manifest) as manifest_file:
+            for line in manifest_file:
+                fields = line.rstrip('\n').split('\t')
+                if fields[0] and not fields[0].startswith('#'):
+                    stats_files.append((fields[0], fields[1]) if len(fields) > 1 else (None, fields[0]))
+    return [(sample or re.sub(r'\.(stats|txt)$', '', os.path.basename(path)), path) for sample, path in stats_files]
+
+def _parse_summary(sample_path):
+    """Pool task: SN summary of one stats file as a row of the aggregate table"""
+    sample, path = sample_path
+    row = {'sample': sample, 'path': path, 'mtime': os.path.getmtime(path)}
+    row.update(SamtoolsStats.parse_samtools_stats(path))
+    return row
+
+def read_table(path):
+    """Reads an aggregate table back, sample and path as strings (all-digit sample names included) and
+    floats exactly as written, so mtimes compare equal to os.path.getmtime again"""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path).astype({'sample': str, 'path': str})
+    return pd.read_csv(path, sep='\t', dtype={'sample': str, 'path': str}, float_precision='round_trip')
+
+def write_table(df, path):
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, sep='\t', index=False)
+
+def aggregate_stats(stats_files, output=None, workers=1, incremental=True):
+    """Parses many stats files on a process pool into one samples x metrics table. In incremental
+    mode the rows of the previous output are reused for the files whose mtime has not changed
+    since it was written, so only new and modified files are parsed again. Listed files that do not
+    exist are skipped with a warning.
+
+    Arguments:
+        stats_files {list} -- (sample, path) tuples, see collect_stats_files
+
+    Keyword Arguments:
+        output {str} -- Table to write, .parquet for Parquet (needs pyarrow) otherwise TSV (default: {None})
+        workers {int} -- Number of worker processes (default: {1})
+        incremental {bool} -- Reuse unchanged rows of an existing output (default: {True})
+
+    Returns:
+        pd.DataFrame -- One row per stats file: sample, path, mtime and every SN metric
+    """
+    previous = {}
+    if incremental and output and os.path.exists(output):
+        previous_df = read_table(output)
+        previous = {row['path']: row for row in previous_df.to_dict('records')}
+    rows = []
+    to_parse = []
+    existing = []
+    for sample, path in stats_files:
+        if os.path.exists(path):
+            existing.append((sample, path))
+        else:
+            logger.warning("Skipping missing stats file {p}".format(p=path))
+    stats_files = existing
+    for sample, path in stats_files:
+        row = previous.get(path)
+        if row is not None and row['mtime'] == os.path.getmtime(path) and row['sample'] == sample:
+            rows.append(row)
+        else:
+            to_parse.append((sample, path))
+    if workers > 1 and len(to_parse) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            rows += pool.map(_parse_summary, to_parse, chunksize=max(1, len(to_parse)//(workers*4)))
+    else:
+        rows += list(map(_parse_summary, to_parse))
+    logger.info("Parsed {p} stats files, reused {r} unchanged rows".format(p=len(to_parse), r=len(rows)-len(to_parse)))
+    table = pd.DataFrame(rows)
+    if table.empty:
+        table = pd.DataFrame(columns=ID_COLUMNS)
+    order = {path: idx for idx, (sample, path) in enumerate(stats_files)}
+    table = table.sort_values('path', key=lambda paths: paths.map(order)).reset_index(drop=True)
+    metrics = [column for column in table.columns if column not in ID_COLUMNS]
+    table = table[ID_COLUMNS + metrics]
+    if output:
+        write_table(table, output)
+    return table
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("-s","--stats_file",type=str,required=True, help="Output of samtools stats")
+    parser.add_argument("-s","--stats_file",type=str, help="Output of samtools stats")
+    parser.add_argument("-g","--glob",type=str, help="Glob pattern of stats files to aggregate")
+    parser.add_argument("-m","--manifest",type=str, help="File listing stats files to aggregate (path or sample<TAB>path per line)")
+    parser.add_argument("-o","--output",type=str, help="Aggregate table, .parquet for Parquet otherwise TSV")
+    parser.add_argument("-w","--workers",type=int, default=multiprocessing.cpu_count(), help="Worker processes for aggregation")
+    parser.add_argument("--full", action="store_true", help="Re-parse every file instead of only the ones modified since the last output")
     args = parser.parse_args()
-    stats_file = SamtoolsStats(args.stats_file)
-    stats_file.print_stats()
+    if args.glob or args.manifest:
+        if not args.output:
+            parser.error("--output is required when aggregating")
+        setup_logger()
+        stats_files = collect_stats_files(pattern=args.glob, manifest=args.manifest)
+        aggregate_stats(stats_files, output=args.output, workers=args.workers, incremental=not args.full)
+    elif args.stats_file:
+        stats_file = SamtoolsStats(args.stats_file)
+        stats_file.print_stats()
+    else:
+        parser.error("One of --stats_file, --glob or --manifest is required")
@@ -90,10 +90,11 @@ class VCF:
     def explode_mnvs(self,vcf_df):
         output_df = vcf_df.copy(deep=True)
         new_rows = []
+        n_mnvs = 0
         for idx, row in vcf_df.iterrows():
             if ((len(row.REF) == len(row.ALT)) and len(row.REF) > 1):
                 # Is a MNV
-                self.logger.debug("Found an MNV. Here is what it is: {mnv}".format(mnv=row))
+                n_mnvs += 1
                 for i in range(len(row.ALT)):
                     cur_new_row = row.copy(deep=True)
                     new_pos = cur_new_row.POS+i
@@ -103,9 +104,9 @@ class VCF:
                     cur_new_row.REF = new_ref
                     cur_new_row.ALT = new_alt
                     new_rows.append(cur_new_row)
-                self.logger.debug("Exploded the MNV into {n} variants".format(n=len(new_rows)))
+        self.logger.debug("Exploded %d MNVs into %d variants", n_mnvs, len(new_rows))
         new_rows_df = pd.DataFrame(new_rows)
-        return output_df.append(new_rows_df)
+        return pd.concat([output_df, new_rows_df])
 
     def write_vcf(self, vcf_df, output_path, header=None, sample_columns=None, verbose=True):
         """[Writes a VCF from the vcf dataframe, to 4.2 specification (["CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO"]) + sample_columns]
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import argparse
+import os
 import sys
 import pandas as pd
 import pysam
@@ -7,33 +8,66 @@ from Bio import SeqIO
 
 
 class VCFwriter(object):
+    ## FORMAT fields written when the dataframe has a column of the same name
+    format_fields = {
+        'GQ': ('1', 'Integer', 'Genotype Quality'),
+        'PL': ('G', 'Integer', 'Phred-scaled genotype likelihoods'),
+    }
     def __init__(self):
         pass
 
-    def create(fasta, sample, input_file, output_vcf):
+    @staticmethod
+    def get_contigs(fasta):
+        """ (name, length) of every contig in fasta, from its .fai index when there is one
+        """
+        fai = fasta + ".fai"
+        if os.path.exists(fai):
+            fai_df = pd.read_csv(fai, sep="\t", header=None, usecols=[0, 1], dtype={0: str})
+            return list(fai_df.itertuples(index=False, name=None))
+        with open(fasta) as fasta_handle:
+            return [(record.id, len(record.seq)) for record in SeqIO.parse(fasta_handle, 'fasta')]
+
+    def create(self, fasta, sample, input_file, output_vcf):
         df = pd.read_csv(input_file, delimiter='\t')
+        self.write_dataframe(df, fasta, sample, output_vcf)
+
+    def write_dataframe(self, df, fasta, sample, output_vcf):
+        """ Writes the variants in df (#CHROM, POS, REF, ALT columns, ALT comma delimited for
+        multi-allelic sites) sorted in the contig order of fasta. Optional GT (tuple), QUAL and
+        FILTER columns are used when present, otherwise every record is PASS with GT 0/1. GQ and PL
+        columns are written as the matching FORMAT fields.
+        """
         vcfh = pysam.VariantHeader()     
         vcfh.add_sample(sample)
-        fasta_sequences = SeqIO.parse(open(fasta),'fasta')
         contigOrder = []
         
-        for fasta in fasta_sequences:
-            contig_name, contig_len = fasta.id, len(fasta.seq)
+        for contig_name, contig_len in self.get_contigs(fasta):
             contigOrder.append(contig_name)
-            vcfh.add_meta('contig', items=[('ID', contig_name),
-                                       ('length', contig_len)])
-        fasta_sequences.close()
+            vcfh.contigs.add(contig_name, length=int(contig_len))
         contigOrderIndex = dict(zip(contigOrder,range(len(contigOrder))))
+        df = df.copy()
         df['#CHROM_rank'] = df['#CHROM'].map(contigOrderIndex)
         df.sort_values(['#CHROM_rank', 'POS'], \
                            ascending = [True, True], inplace = True)
-        df.drop('#CHROM_rank', 1, inplace = True)
+        df.drop('#CHROM_rank', axis=1, inplace = True)
+        if 'FILTER' in df.columns:
+            for filter_name in sorted(set(df['FILTER']) - {'PASS'}):
+                vcfh.add_meta('FILTER', items=[('ID', filter_name), ('Description', filter_name)])
         vcfh.add_meta('FORMAT',items=[('ID',"GT"),('Number',1),('Type','String'),('Description','Genotype')])
+        format_columns = [field for field in self.format_fields if field in df.columns]
+        for field in format_columns:
+            number, field_type, description = self.format_fields[field]
+            vcfh.add_meta('FORMAT',items=[('ID',field),('Number',number),('Type',field_type),('Description',description)])
         vcf = pysam.VariantFile(output_vcf, "w", header=vcfh)
-        for i, r in df.iterrows():
-            x=vcf.new_record(contig=str(r['#CHROM']), start=r['POS']-1, stop=r['POS'],
-                             alleles=(r['REF'],r['ALT']),filter='PASS')
-            x.samples[sample]['GT'] = (0,1)
+        for r in df.to_dict('records'):
+            x=vcf.new_record(contig=str(r['#CHROM']), start=int(r['POS'])-1, stop=int(r['POS']),
+                             alleles=(r['REF'],) + tuple(str(r['ALT']).split(',')),
+                             filter=r.get('FILTER', 'PASS'))
+            if 'QUAL' in r:
+                x.qual = float(r['QUAL'])
+            x.samples[sample]['GT'] = tuple(r['GT']) if 'GT' in r else (0,1)
+            for field in format_columns:
+                x.samples[sample][field] = r[field]
             vcf.write(x)
         vcf.close()
 
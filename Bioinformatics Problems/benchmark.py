@@ -0,0 +1,215 @@
+import os
+import argparse
+import logging
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+from utils import setup_logger
+from stats_utils import binom_intervals, sensitivity_stats_table
+
+logger = logging.getLogger(__name__)
+
+VARIANT_KEYS = ["CHROM", "POS", "REF", "ALT"]
+VAR_TYPES = ["SNV", "INDEL", "MNV"]
+AF_BINS = [0, 0.05, 0.1, 0.2, 0.5, 1.0]
+# Match status codes of compare_variants
+TP, FN, FP = 0, 1, 2
+ALL = "ALL"
+
+def read_benchmark_vcf(vcf_path, af_key="AF"):
+    """[Reads the columns needed for benchmarking from a (optionally gzipped) VCF, one row per ALT allele]
+
+    Arguments:
+        vcf_path {[str]} -- [Path to the VCF]
+
+    Keyword Arguments:
+        af_key {[str]} -- [INFO key holding the per allele frequency] (default: {"AF"})
+
+    Returns:
+        [pd.DataFrame] -- [CHROM, POS, REF, ALT, VAR_TYPE and AF (NaN when the INFO key is missing) columns]
+    """
+    df = pd.read_csv(vcf_path, sep="\t", comment="#", header=None, usecols=[0, 1, 3, 4, 7],
+                     names=["CHROM", "POS", "REF", "ALT", "INFO"], dtype={"CHROM": str, "REF": str, "ALT": str, "INFO": str})
+    df["AF"] = df["INFO"].str.extract(r"(?:^|;)" + af_key + r"=([^;]+)", expand=False)
+    multi = df["ALT"].str.contains(",", regex=False)
+    if multi.any():
+        # only the multi-allelic records go through the (slower) explode
+        split = df[multi].copy()
+        split["ALT"] = split["ALT"].str.split(",")
+        split["AF"] = [afs.split(",") if isinstance(afs, str) and afs.count(",") == len(alts) - 1 else [np.nan]*len(alts)
+                       for alts, afs in zip(split["ALT"], split["AF"])]
+        df = pd.concat([df[~multi], split.explode(["ALT", "AF"])]).sort_index(kind="stable")
+    df = df[~df["ALT"].isin(["*", ".", "<*>", "<NON_REF>"])].drop(columns="INFO").reset_index(drop=True)
+    df["AF"] = pd.to_numeric(df["AF"], errors="coerce")
+    ref_length, alt_length = df["REF"].str.len().to_numpy(), df["ALT"].str.len().to_numpy()
+    df["VAR_TYPE"] = np.where(ref_length != alt_length, "INDEL", np.where(ref_length == 1, "SNV", "MNV"))
+    return df
+
+def compare_variants(truth_df, query_df):
+    """[Vectorized counterpart of VCF_utils.vcf_concordance_sets: matches truth and query alleles on
+    CHROM, POS, REF and ALT with a single merge]
+
+    Arguments:
+        truth_df {[pd.DataFrame]} -- [Truth variants, see read_benchmark_vcf]
+        query_df {[pd.DataFrame]} -- [Query variants, see read_benchmark_vcf]
+
+    Returns:
+        [pd.DataFrame] -- [One row per distinct allele of either set with VAR_TYPE, AF (truth AF, the
+        query AF when the truth has none) and STATUS (TP, FN or FP code)]
+    """
+    columns = VARIANT_KEYS + ["VAR_TYPE", "AF"]
+    merged = truth_df[columns].drop_duplicates(VARIANT_KEYS).merge(query_df[columns].drop_duplicates(VARIANT_KEYS),
+                                                                   on=VARIANT_KEYS + ["VAR_TYPE"], how="outer",
+                                                                   suffixes=("_truth", "_query"), indicator=True)
+    merged["AF"] = merged["AF_truth"].fillna(merged["AF_query"])
+    merged["STATUS"] = merged["_merge"].map({"both": TP, "left_only": FN, "right_only": FP}).astype(np.int64)
+    return merged[columns + ["STATUS"]]
+
+def load_bed_intervals(bed_path):
+    """[Reads a BED file into sorted, merged intervals per chromosome]
+
+    Returns:
+        [dict] -- [chromosome -> (starts, ends) arrays, 0-based half open]
+    """
+    bed = pd.read_csv(bed_path, sep="\t", comment="#", header=None, usecols=[0, 1, 2],
+                      names=["chrom", "start", "end"], dtype={"chrom": str})
+    bed = bed[~bed["chrom"].str.startswith(("track", "browser"))]
+    intervals = {}
+    for chrom, chrom_bed in bed.sort_values(["chrom", "start"]).groupby("chrom", sort=False):
+        starts, ends = chrom_bed["start"].to_numpy(np.int64), chrom_bed["end"].to_numpy(np.int64)
+        reach = np.maximum.accumulate(ends)
+        first = np.concatenate(([True], starts[1:] > reach[:-1]))
+        last = np.concatenate((first[1:], [True]))
+        intervals[chrom] = (starts[first], reach[last])
+    return intervals
+
+def in_regions(chroms, starts, ends, intervals):
+    """[Flags the variants overlapping any interval, by binary search on the merged interval starts]
+
+    Arguments:
+        chroms {[array-like]} -- [Chromosome of every variant]
+        starts {[np.ndarray]} -- [0-based variant starts]
+        ends {[np.ndarray]} -- [Variant ends, exclusive]
+        intervals {[dict]} -- [Output of load_bed_intervals]
+
+    Returns:
+        [np.ndarray] -- [Boolean overlap flag per variant]
+    """
+    overlaps = np.zeros(len(starts), dtype=bool)
+    for chrom, rows in pd.Series(chroms).groupby(chroms, sort=False).indices.items():
+        if chrom not in intervals:
+            continue
+        interval_starts, interval_ends = intervals[chrom]
+        # merged intervals have sorted ends too, so only the last one starting before the variant end can overlap
+        candidate = np.searchsorted(interval_starts, ends[rows], side="left") - 1
+        overlaps[rows] = (candidate >= 0) & (interval_ends[np.maximum(candidate, 0)] > starts[rows])
+    return overlaps
+
+## Variant coordinates of the worker processes, set once per worker by _init_worker
+_worker_variants = None
+
+def _init_worker(variants):
+    """Pool initializer: keeps the variant coordinates in the worker instead of pickling them per stratum"""
+    global _worker_variants
+    _worker_variants = variants
+
+def _region_membership(bed_path):
+    """Pool task: overlap flags of the worker's variants with one BED stratum"""
+    return in_regions(*_worker_variants, load_bed_intervals(bed_path))
+
+def count_strata(compared, regions=None, af_bins=AF_BINS, workers=1):
+    """[Counts TP/FN/FP for every region x variant type x AF bin stratum in one pass. Region
+    membership is computed per BED file, on a process pool when workers > 1; the counts of every
+    region are then a single bincount over the combined stratum code]
+
+    Arguments:
+        compared {[pd.DataFrame]} -- [Output of compare_variants]
+
+    Keyword Arguments:
+        regions {[dict]} -- [Region name -> BED path] (default: {None})
+        af_bins {[list]} -- [AF bin edges] (default: {AF_BINS})
+        workers {[int]} -- [Worker processes for the region strata] (default: {1})
+
+    Returns:
+        [tuple] -- [(region names, variant types, AF bin labels, counts array of shape
+        regions x types x bins x 3), the types and bins including an ALL level]
+    """
+    regions = regions or {}
+    starts = compared["POS"].to_numpy(np.int64) - 1
+    variants = (compared["CHROM"].to_numpy(), starts, starts + compared["REF"].str.len().to_numpy())
+    if workers > 1 and len(regions) > 1:
+        with multiprocessing.Pool(min(workers, len(regions)), initializer=_init_worker, initargs=(variants,)) as pool:
+            memberships = pool.map(_region_membership, list(regions.values()))
+    else:
+        memberships = [in_regions(*variants, load_bed_intervals(bed_path)) for bed_path in regions.values()]
+    af_codes = pd.cut(compared["AF"], af_bins, include_lowest=True)
+    af_labels = [str(label) for label in af_codes.cat.categories] + ["NA"]
+    af_codes = af_codes.cat.codes.to_numpy().astype(np.int64)
+    af_codes[af_codes < 0] = len(af_labels) - 1
+    type_codes = pd.Categorical(compared["VAR_TYPE"], categories=VAR_TYPES).codes.astype(np.int64)
+    n_strata = len(VAR_TYPES)*len(af_labels)*3
+    codes = (type_codes*len(af_labels) + af_codes)*3 + compared["STATUS"].to_numpy()
+    counts = np.stack([np.bincount(codes, minlength=n_strata)] +
+                      [np.bincount(codes[membership], minlength=n_strata) for membership in memberships])
+    counts = counts.reshape(len(regions) + 1, len(VAR_TYPES), len(af_labels), 3)
+    counts = np.concatenate([counts, counts.sum(axis=1, keepdims=True)], axis=1)
+    counts = np.concatenate([counts, counts.sum(axis=2, keepdims=True)], axis=2)
+    return [ALL] + list(regions), VAR_TYPES + [ALL], af_labels + [ALL], counts
+
+def benchmark(truth_vcf, query_vcf, regions=None, af_bins=AF_BINS, workers=1, confint=0.95):
+    """[Stratified comparison of a query callset against a truth set]
+
+    Arguments:
+        truth_vcf {[str]} -- [Truth VCF]
+        query_vcf {[str]} -- [Query VCF]
+
+    Keyword Arguments:
+        regions {[dict]} -- [Region name -> BED path, every region is a stratum on top of ALL] (default: {None})
+        af_bins {[list]} -- [AF bin edges] (default: {AF_BINS})
+        workers {[int]} -- [Worker processes for the region strata] (default: {1})
+        confint {float} -- [The % for which confidence intervals are computed] (default: {0.95})
+
+    Returns:
+        [pd.DataFrame] -- [One row per non empty stratum: Region, VAR_TYPE, AF_bin, the
+        sensitivity_stats_table columns, FP, Precision and its CIs]
+    """
+    truth_df, query_df = read_benchmark_vcf(truth_vcf), read_benchmark_vcf(query_vcf)
+    logger.info("Loaded {t} truth and {q} query alleles".format(t=len(truth_df), q=len(query_df)))
+    compared = compare_variants(truth_df, query_df)
+    region_names, var_types, af_labels, counts = count_strata(compared, regions=regions, af_bins=af_bins, workers=workers)
+    strata = pd.MultiIndex.from_product([region_names, var_types, af_labels], names=["Region", "VAR_TYPE", "AF_bin"])
+    counts = counts.reshape(-1, 3)
+    tp, fn, fp = counts[:, TP], counts[:, FN], counts[:, FP]
+    table = sensitivity_stats_table(tp, tp + fn, confint=confint, index=strata)
+    table["FP"] = fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        table["Precision"] = np.where(tp + fp > 0, np.round(tp / (tp + fp), 2)*100, np.nan)
+    table["Precision_Min_CI"], table["Precision_Max_CI"] = binom_intervals(tp, tp + fp, confint)
+    return table[counts.sum(axis=1) > 0].reset_index()
+
+def parse_region_args(region_args):
+    """NAME=BED or BED (named after the file) -> {name: path}"""
+    regions = {}
+    for region_arg in region_args or []:
+        name, sep, path = region_arg.rpartition("=")
+        regions[name if sep else os.path.basename(path).split(".")[0]] = path
+    return regions
+
+def main():
+    parser = argparse.ArgumentParser(description="Stratified sensitivity and precision of a query VCF against a truth VCF")
+    parser.add_argument("truth_vcf", help="Truth VCF")
+    parser.add_argument("query_vcf", help="Query VCF")
+    parser.add_argument("-b", "--bed", action="append", help="Region stratum as NAME=BED or BED, can be repeated")
+    parser.add_argument("--af-bins", type=float, nargs="+", default=AF_BINS, help="AF bin edges")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(), help="Worker processes for the region strata")
+    parser.add_argument("-o", "--output", default="benchmark.tsv", help="Output table")
+    parser.add_argument("-d", "--debug", action="store_true", help="Debug logging")
+    args = parser.parse_args()
+    setup_logger(debug=args.debug)
+    table = benchmark(args.truth_vcf, args.query_vcf, regions=parse_region_args(args.bed), af_bins=args.af_bins, workers=args.workers)
+    table.to_csv(args.output, sep="\t", index=False)
+    logger.info("Benchmark table written to {o}".format(o=args.output))
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 import re
+import numpy as np
 
 class CIGAR(object):
-    cigar_regex = r'\d+[IDMPX]+'
+    cigar_regex = r'(\d+)([MIDNSHP=X])'
     pattern = re.compile(cigar_regex)
     cigar_dict = {    
         'M': [1, 1],    # Represents a MATCH in sequence
@@ -14,44 +15,126 @@ class CIGAR(object):
         '=': [1, 1],    # Represents more granular version of MATCH
         'X': [1, 1],    # Represents mismatch. M segments can be decomposed into = and X segments
     }
+    # Operations in the order of their BAM op codes, so op_codes can be compared with pysam cigartuples
+    ops = 'MIDNSHP=X'
+    op_scores = np.array(list(map(cigar_dict.get, ops)), dtype=np.int64)
+
     def __init__(self, cstring, start=0):
         """Constructor for CIGAR class. Takes in the input CIGAR string, separates individual CIGAR
-        operations and then creates a expanded score list for the sequence based on the CIGAR.
+        operations and stores them run-length encoded: one op code and one length per operation, along
+        with the cumulative transcript (query) and reference offsets at the start of every operation.
         Primarily used for querying reference positions corresponding to given transcript positions 
 
         Args:
-            cstring ([type]): [description]
-            start (int, optional): [description]. Defaults to 0.
+            cstring (str): CIGAR string, e.g. 4M3I6D
+            start (int, optional): Reference position the alignment starts at. Defaults to 0.
         """
         self.cstring = cstring
         self.cparsed = self.separate_cigar()
         self.start = start
-        self.cigar_scorer = self.expand_cigar()
-        
+        self.op_codes = np.array([self.ops.index(item[-1]) for item in self.cparsed], dtype=np.uint8)
+        self.op_lengths = np.array([int(item[:-1]) for item in self.cparsed], dtype=np.int64)
+        scores = self.op_scores[self.op_codes].reshape(-1, 2)*self.op_lengths[:, None]
+        self.query_offsets = np.concatenate(([0], np.cumsum(scores[:, 0])))
+        self.ref_offsets = np.concatenate(([0], np.cumsum(scores[:, 1])))
+
+    @property
+    def query_length(self):
+        """Number of transcript (query) bases consumed by the CIGAR"""
+        return int(self.query_offsets[-1])
+
+    @property
+    def reference_length(self):
+        """Number of reference bases consumed by the CIGAR"""
+        return int(self.ref_offsets[-1])
+
+    @property
+    def cigar_scorer(self):
+        """Per position [transcript, reference] score list. Expanded on every access, so hold
+        on to the result instead of reading this repeatedly.
+        """
+        return self.expand_cigar()
+
+    def query_to_ref(self, pos):
+        """Reference position of a transcript (query) position, found by binary search over the
+        cumulative operation offsets. Deletions and reference skips in front of the query base are
+        stepped over; bases inside an insertion or soft clip have no reference base of their own and
+        map to the reference position following them.
+
+        Args:
+            pos (int): 0-based transcript position
+
+        Returns:
+            int: Reference position, -1 if pos is outside the transcript
+        """
+        return int(self.query_to_ref_array(np.array([pos]))[0])
+
+    def ref_to_query(self, pos):
+        """Transcript (query) position of a reference position, found by binary search over the
+        cumulative operation offsets. Reference positions inside a deletion or skip have no query
+        base of their own and map to the query position following them.
+
+        Args:
+            pos (int): Reference position
+
+        Returns:
+            int: 0-based transcript position, -1 if pos is outside the aligned reference span
+        """
+        return int(self.ref_to_query_array(np.array([pos]))[0])
+
+    def query_to_ref_array(self, positions):
+        """Vectorized query_to_ref over an array of transcript positions"""
+        positions = np.asarray(positions, dtype=np.int64)
+        return self._translate(positions, self.query_offsets, self.ref_offsets, 1, self.start)
+
+    def ref_to_query_array(self, positions):
+        """Vectorized ref_to_query over an array of reference positions"""
+        positions = np.asarray(positions, dtype=np.int64)
+        return self._translate(positions - self.start, self.ref_offsets, self.query_offsets, 0, 0)
+
+    def aligned_blocks(self):
+        """Gapless aligned blocks of the alignment, i.e. the runs of operations that consume both
+        the transcript and the reference (M, = and X)
+
+        Returns:
+            tuple: (ref_starts, ref_ends, query_starts) arrays, reference ends exclusive
+        """
+        aligned = np.flatnonzero(self.op_scores[self.op_codes].reshape(-1, 2).all(axis=1))
+        ref_starts = self.start + self.ref_offsets[aligned]
+        return ref_starts, ref_starts + self.op_lengths[aligned], self.query_offsets[aligned]
+
+    def _translate(self, offsets, from_offsets, to_offsets, to_axis, to_start):
+        """Maps offsets from one coordinate system (from_offsets) onto the other (to_offsets)"""
+        if not len(self.op_codes):
+            return np.full(offsets.shape, -1, dtype=np.int64)
+        valid = (offsets >= 0) & (offsets < from_offsets[-1])
+        # side='right' steps over the operations that do not consume this coordinate (zero length runs)
+        op_index = np.clip(np.searchsorted(from_offsets, offsets, side='right') - 1, 0, len(self.op_codes) - 1)
+        consumes_target = self.op_scores[self.op_codes[op_index], to_axis]
+        translated = to_start + to_offsets[op_index] + (offsets - from_offsets[op_index])*consumes_target
+        return np.where(valid, translated, -1)
+
     def separate_cigar(self):
         """Helper method to separate all the CIGAR operations into individual operations
-        Example: 4M3I6D -> ['4M','3I','6D']
+        Example: 4M3I6D -> ['4M','3I','6D']. The SAM placeholder "*" (unmapped or unavailable CIGAR)
+        gives no operations, i.e. an empty alignment.
 
         Returns:
             list: separated CIGAR operations in the form of a list. List is in the original order as input.
         """
-        cigar_parsed = re.findall(self.pattern, self.cstring)
+        if self.cstring == '*':
+            return []
+        cigar_parsed = [length+op for length, op in re.findall(self.pattern, self.cstring)]
+        if sum(map(len, cigar_parsed)) != len(self.cstring):
+            raise ValueError(f"Invalid CIGAR string: {self.cstring}")
         return cigar_parsed
-    
+
     def expand_cigar(self):
-        """Helper public method to generate a per position score 
-        for transcript and reference based on the CIGAR Operation 
+        """Helper public method to generate a per position score
+        for transcript and reference based on the CIGAR Operation
         Example: 4M -> [[1,1],[1,1],[1,1],[1,1]]
 
         Returns:
             list: List containing an expanded score version of the CIGAR string
         """
-        cigar_dict = self.cigar_dict
-        ref_q_cigar_seq_incrementer = []
-        for item in self.cparsed:
-            clen = int(re.findall(r'\d+',item)[0])
-            cop = re.findall(r'[A-Z]+', item)[0]
-            score_for_op = cigar_dict[cop]
-            cur_interval_scores = [score_for_op for i in range(clen)]
-            ref_q_cigar_seq_incrementer+=cur_interval_scores
-        return ref_q_cigar_seq_incrementer
\ No newline at end of file
+        return np.repeat(self.op_scores[self.op_codes], self.op_lengths, axis=0).tolist()
@@ -0,0 +1,20 @@
+import logging
+import pytest
+import utils
+
+@pytest.fixture
+def reset_logging():
+	"""Stops the process-wide QueueListener of utils.setup_logger after the test and forgets its
+	handlers and log files, so no handler (or open log file) leaks into later tests"""
+	root = logging.getLogger()
+	handlers, level = list(root.handlers), root.level
+	yield
+	listener = utils._listener
+	utils._stop_listener()
+	if listener is not None:
+		for handler in listener.handlers:
+			handler.close()
+	utils._listener = None
+	utils._log_files.clear()
+	root.handlers = handlers
+	root.setLevel(level)
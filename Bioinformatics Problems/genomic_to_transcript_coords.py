@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+
+from transcript_to_genomic_coords import TranscriptIndex
+from utils import setup_logger
+
+logger = logging.getLogger(__name__)
+
+## Aligned blocks longer than this are split, which bounds how far back a lookup has to search
+MAX_BLOCK_LENGTH = 10000
+OUTPUT_COLUMNS = ['CHROM','POS','Transcript','tPos']
+
+class GenomicIndex(object):
+    def __init__(self, transcript_index, max_block_length=MAX_BLOCK_LENGTH):
+        """Reverse (genome -> transcript) index built from the CIGARs of a TranscriptIndex.
+        Per chromosome it keeps the aligned blocks of every transcript sorted by reference start.
+        Blocks are split to at most max_block_length bases, so every block overlapping a position starts
+        in the window (pos - max_block_length, pos] and is found by binary search on the starts.
+
+        Args:
+            transcript_index (TranscriptIndex): Index built from the transcripts file
+            max_block_length (int, optional): Longest block kept unsplit. Defaults to MAX_BLOCK_LENGTH.
+        """
+        self.max_block_length = max_block_length
+        self.transcript_ids = np.array(list(transcript_index.transcripts), dtype=object)
+        blocks = {}
+        for transcript_number, (chromosome, cigar_obj) in enumerate(transcript_index.transcripts.values()):
+            ref_starts, ref_ends, query_starts = cigar_obj.aligned_blocks()
+            blocks.setdefault(chromosome, []).append((ref_starts, ref_ends, query_starts,
+                                                      np.full(ref_starts.shape[0], transcript_number)))
+        self.blocks = {}
+        for chromosome, chrom_blocks in blocks.items():
+            ref_starts, ref_ends, query_starts, transcripts = (np.concatenate(column) for column in zip(*chrom_blocks))
+            ref_starts, ref_ends, query_starts, transcripts = self._split_blocks(ref_starts, ref_ends, query_starts, transcripts)
+            order = np.argsort(ref_starts, kind='stable')
+            self.blocks[chromosome] = (ref_starts[order], ref_ends[order], query_starts[order], transcripts[order])
+        logger.debug("Indexed aligned blocks of %d transcripts on %d chromosomes", len(self.transcript_ids), len(self.blocks))
+
+    @classmethod
+    def from_file(cls, input_base_file, max_block_length=MAX_BLOCK_LENGTH):
+        """Builds the index from the 4 column transcripts file"""
+        return cls(TranscriptIndex.from_file(input_base_file), max_block_length=max_block_length)
+
+    def _split_blocks(self, ref_starts, ref_ends, query_starts, transcripts):
+        """Splits blocks longer than max_block_length into consecutive pieces"""
+        pieces = (ref_ends - ref_starts + self.max_block_length - 1) // self.max_block_length
+        if not (pieces > 1).any():
+            return ref_starts, ref_ends, query_starts, transcripts
+        block = np.repeat(np.arange(ref_starts.shape[0]), pieces)
+        piece_offset = (np.arange(block.shape[0]) - np.repeat(np.cumsum(pieces) - pieces, pieces))*self.max_block_length
+        new_starts = ref_starts[block] + piece_offset
+        new_ends = np.minimum(new_starts + self.max_block_length, ref_ends[block])
+        return new_starts, new_ends, query_starts[block] + piece_offset, transcripts[block]
+
+    def lookup(self, chromosome, positions):
+        """Finds the transcript positions overlapping genomic positions on one chromosome.
+
+        Args:
+            chromosome (str): Chromosome of the positions
+            positions (array-like): 0-based genomic positions
+
+        Returns:
+            tuple: (query_indices, transcript_ids, transcript_positions) arrays with one entry per
+            overlap; query_indices point into positions. Positions without overlaps are left out.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if chromosome not in self.blocks:
+            empty = np.array([], dtype=np.int64)
+            return empty, np.array([], dtype=object), empty
+        ref_starts, ref_ends, query_starts, transcripts = self.blocks[chromosome]
+        lo = np.searchsorted(ref_starts, positions - self.max_block_length, side='right')
+        hi = np.searchsorted(ref_starts, positions, side='right')
+        n_candidates = hi - lo
+        query_indices = np.repeat(np.arange(positions.shape[0]), n_candidates)
+        candidates = np.repeat(lo - (np.cumsum(n_candidates) - n_candidates), n_candidates) + np.arange(query_indices.shape[0])
+        overlapping = ref_ends[candidates] > positions[query_indices]
+        query_indices, candidates = query_indices[overlapping], candidates[overlapping]
+        transcript_positions = query_starts[candidates] + positions[query_indices] - ref_starts[candidates]
+        return query_indices, self.transcript_ids[transcripts[candidates]], transcript_positions
+
+    def map_positions(self, chromosomes, positions):
+        """Maps genomic positions on any chromosome to the transcripts overlapping them, one
+        chromosome batch at a time.
+
+        Args:
+            chromosomes (array-like): Chromosome of every position
+            positions (array-like): 0-based genomic positions
+
+        Returns:
+            pandas.DataFrame: query_index (row of the input), CHROM, POS, Transcript and tPos
+            columns with one row per overlapping transcript
+        """
+        chromosomes = pd.Series(chromosomes).reset_index(drop=True)
+        positions = np.asarray(positions, dtype=np.int64)
+        results = []
+        for chromosome, rows in chromosomes.groupby(chromosomes, sort=False).indices.items():
+            query_indices, transcript_ids, transcript_positions = self.lookup(chromosome, positions[rows])
+            results.append(pd.DataFrame({'query_index': rows[query_indices], 'CHROM': chromosome,
+                                         'POS': positions[rows][query_indices], 'Transcript': transcript_ids,
+                                         'tPos': transcript_positions}))
+        if not results:
+            return pd.DataFrame(columns=['query_index'] + OUTPUT_COLUMNS)
+        return pd.concat(results, ignore_index=True).sort_values(['query_index', 'Transcript'], kind='stable').reset_index(drop=True)
+
+    def map_vcf(self, vcf_df):
+        """Maps the variants of a VCF dataframe (see VCF.load_vcf) to the transcripts overlapping them.
+        VCF positions are 1-based, so POS - 1 is looked up; POS in the output stays the VCF POS.
+
+        Args:
+            vcf_df (pandas.DataFrame): VCF dataframe with CHROM and POS columns
+
+        Returns:
+            pandas.DataFrame: Same columns as map_positions, query_index being the row number in vcf_df
+        """
+        mapped = self.map_positions(vcf_df['CHROM'].astype(str), vcf_df['POS'].to_numpy() - 1)
+        mapped['POS'] = mapped['POS'] + 1
+        return mapped
+
+def read_vcf_positions(vcf_path):
+    """Reads only the CHROM and POS columns of a (optionally gzipped) VCF"""
+    return pd.read_csv(vcf_path, sep="\t", comment="#", header=None, usecols=[0, 1],
+                       names=['CHROM','POS'], dtype={'CHROM': str})
+
+def main():
+    parser = argparse.ArgumentParser(description="Map VCF variants to the transcript positions overlapping them")
+    parser.add_argument("transcripts_file", help="4 column transcripts file (Transcript, Chromosome, Pos, Cigar)")
+    parser.add_argument("vcf", help="VCF to annotate")
+    parser.add_argument("-o", "--output", default="-", help="Output file, - for stdout")
+    args = parser.parse_args()
+    setup_logger()
+    genomic_index = GenomicIndex.from_file(args.transcripts_file)
+    mapped = genomic_index.map_vcf(read_vcf_positions(args.vcf))
+    mapped[OUTPUT_COLUMNS].to_csv(sys.stdout if args.output == '-' else args.output, sep="\t", index=False, header=None)
+
+if __name__ == '__main__':
+    main()
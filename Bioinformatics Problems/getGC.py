@@ -1,23 +1,151 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+# Byte lookup tables: GC as written (getGC only counts upper case C/G), GC of either case (soft-masked FASTA) and ACGT
+_GC_UPPER = np.zeros(256, dtype=bool)
+_GC_UPPER[np.frombuffer(b"CG", dtype=np.uint8)] = True
+_GC_ANY_CASE = np.zeros(256, dtype=bool)
+_GC_ANY_CASE[np.frombuffer(b"CGcg", dtype=np.uint8)] = True
+_ACGT = np.zeros(256, dtype=bool)
+_ACGT[np.frombuffer(b"ACGTacgt", dtype=np.uint8)] = True
+
+def gc_fractions(strlist, case_sensitive=True):
+    """GC fraction of many sequences at once. The sequences are joined into one byte buffer and viewed
+    as a NumPy uint8 array, so the GC count of every sequence is a difference of one cumulative sum.
+
+    Args:
+        strlist (list): Sequences
+        case_sensitive (bool, optional): Only count upper case C and G, as getGC does. Defaults to True.
+
+    Returns:
+        tuple: (gc_fraction, lengths) arrays, gc_fraction is NaN for empty sequences
+    """
+    lengths = np.fromiter(map(len, strlist), dtype=np.int64, count=len(strlist))
+    buffer = np.frombuffer("".join(strlist).encode("ascii", "replace"), dtype=np.uint8)
+    is_gc = (_GC_UPPER if case_sensitive else _GC_ANY_CASE)[buffer]
+    gc_cumsum = np.concatenate(([0], np.cumsum(is_gc, dtype=np.int64)))
+    ends = np.cumsum(lengths)
+    gc_counts = gc_cumsum[ends] - gc_cumsum[ends - lengths]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return gc_counts / lengths, lengths
+
 def getGC(strlist):
-    counts = [(curStr.count("C")+curStr.count("G"),len(curStr)) for curStr in strlist]
-    res = []
-    for (gc,tot) in counts:
-        gc = float(gc)
-        tot = float(tot)
-        if tot != 0:
-            res.append(gc/tot)
-    if (res):
-        maxCount = max(res)
-        indexofMax = res.index(maxCount)
-        strMax = strlist[indexofMax]
-        return (maxCount,strMax,indexofMax)
-    return (0.0,"",0)
+    """Sequence with the highest GC fraction, empty sequences are skipped (ties go to the first one)
+
+    Returns:
+        tuple: (max GC fraction, sequence, index of the sequence in strlist), (0.0, "", 0) if every sequence is empty
+    """
+    if not len(strlist):
+        return (0.0, "", 0)
+    fractions, lengths = gc_fractions(strlist)
+    if not lengths.any():
+        return (0.0, "", 0)
+    indexofMax = int(np.nanargmax(fractions))
+    return (float(fractions[indexofMax]), strlist[indexofMax], indexofMax)
+
+def read_fai(fasta):
+    """Reads the samtools faidx index of a FASTA, building and writing it first if it does not exist
+
+    Returns:
+        pd.DataFrame: name, length, offset, linebases and linewidth per sequence
+    """
+    fai = fasta + ".fai"
+    if not os.path.exists(fai):
+        build_fai(fasta, fai)
+    return pd.read_csv(fai, sep="\t", header=None, usecols=range(5), dtype={0: str},
+                       names=["name", "length", "offset", "linebases", "linewidth"])
+
+def build_fai(fasta, fai):
+    """Writes a samtools faidx compatible index for an uncompressed FASTA"""
+    records = []
+    offset = 0
+    with open(fasta, "rb") as fasta_file:
+        for line in fasta_file:
+            if line.startswith(b">"):
+                records.append([line[1:].split()[0].decode(), 0, offset + len(line), 0, 0])
+            elif records and line.strip():
+                record = records[-1]
+                if not record[3]:
+                    record[3], record[4] = len(line.rstrip(b"\r\n")), len(line)
+                record[1] += len(line.rstrip(b"\r\n"))
+            offset += len(line)
+    with open(fai, "w") as fai_file:
+        for record in records:
+            fai_file.write("\t".join(map(str, record)) + "\n")
+
+def contig_bases(fasta_map, length, offset, linebases, linewidth):
+    """Bases of one sequence as a uint8 array read from the memory-mapped FASTA, line ends dropped by
+    reshaping the lines into a (lines, linewidth) array. The slice is zero padded to whole lines, so a
+    last line without its line end (at the end of the file) is handled like the others."""
+    if not length:
+        return np.zeros(0, dtype=np.uint8)
+    lines = -(-length // linebases)
+    raw = fasta_map[offset:offset + lines*linewidth]
+    padded = np.zeros(lines*linewidth, dtype=np.uint8)
+    padded[:raw.shape[0]] = raw
+    return padded.reshape(lines, linewidth)[:, :linebases].ravel()[:length]
+
+def gc_track(fasta, window=1000, step=None, contigs=None):
+    """Sliding-window GC track over whole chromosomes, for GC-bias correction. The FASTA is memory
+    mapped and every window is a difference of two cumulative sums, so a chromosome costs a few
+    passes over its bases whatever the window and step. GC is counted in either case (soft-masked
+    bases included) and divided by the ACGT bases of the window, so Ns do not dilute it. When the
+    windows do not tile a contig exactly, one last shorter window runs to the contig end, so the
+    final bases are not dropped.
+
+    Args:
+        fasta (str): Uncompressed FASTA, indexed with samtools faidx or indexed on first use
+        window (int, optional): Window size. Defaults to 1000.
+        step (int, optional): Distance between window starts. Defaults to the window size.
+        contigs (list, optional): Sequences to process. Defaults to all of them.
+
+    Returns:
+        pandas.DataFrame: chrom, start, end (0-based half open), gc (NaN for windows without ACGT bases)
+        and acgt (number of ACGT bases) columns
+    """
+    step = step or window
+    fai = read_fai(fasta)
+    if contigs is not None:
+        fai = fai[fai["name"].isin(contigs)]
+    fasta_map = np.memmap(fasta, dtype=np.uint8, mode="r")
+    tracks = []
+    for name, length, offset, linebases, linewidth in fai.itertuples(index=False):
+        bases = contig_bases(fasta_map, length, offset, linebases, linewidth)
+        gc_cumsum = np.concatenate(([0], np.cumsum(_GC_ANY_CASE[bases], dtype=np.int64)))
+        acgt_cumsum = np.concatenate(([0], np.cumsum(_ACGT[bases], dtype=np.int64)))
+        starts = np.arange(0, max(length - window, 0) + 1, step)
+        if starts[-1] + window < length and starts[-1] + step < length:
+            starts = np.append(starts, starts[-1] + step)
+        ends = np.minimum(starts + window, length)
+        acgt = acgt_cumsum[ends] - acgt_cumsum[starts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gc = (gc_cumsum[ends] - gc_cumsum[starts]) / acgt
+        tracks.append(pd.DataFrame({"chrom": name, "start": starts, "end": ends, "gc": gc, "acgt": acgt}))
+    if not tracks:
+        return pd.DataFrame(columns=["chrom", "start", "end", "gc", "acgt"])
+    return pd.concat(tracks, ignore_index=True)
 
 def main():
+    parser = argparse.ArgumentParser(description="GC content of sequences, or a sliding-window GC track of a FASTA")
+    parser.add_argument("-f", "--fasta", help="FASTA to compute the GC track of (bedGraph output)")
+    parser.add_argument("-w", "--window", type=int, default=1000, help="Window size")
+    parser.add_argument("-s", "--step", type=int, help="Step between windows, defaults to the window size")
+    parser.add_argument("-o", "--output", default="-", help="Output bedGraph, - for stdout")
+    args = parser.parse_args()
+    if args.fasta:
+        track = gc_track(args.fasta, window=args.window, step=args.step).dropna(subset=["gc"])
+        track[["chrom", "start", "end", "gc"]].to_csv(sys.stdout if args.output == "-" else args.output,
+                                                      sep="\t", index=False, header=False, float_format="%.4f")
+        return
     s = "CCTGCGGAAGATCGGCACTAGAATAGCCAGAACCGTTTCTCTGAGGCTTCCGGCCTTCCCTCCCACTAATAATTCTGAGG"
     s1 = "CCATCGGTAGCGCATCCTTAGTCCAATTAAGTCCCTATCCAGGCGCTCCGCCGAAGGTCTATATCCATTTGTCAGCAGACACGC"
     s2 = "CCACCCTCGTGGTATGGCTAGGCATTCAGGAACCGGAGAACGCTTCAGACCAGCCCGGACTGGGAACCTGCGGGCAGTAGGTGGAAT"
     li = [s,s1,s2]
     res = getGC(li)
-    print res
+    print(res)
 
+if __name__ == '__main__':
+    main()
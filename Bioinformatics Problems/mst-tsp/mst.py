@@ -5,7 +5,11 @@ Created on Mar 16, 2013
 '''
 #------------------------------------------------- Reference: mst.py from class
 #---------- Addition: funtion heuristic to calculate the heuristic cost of a mst
-import math
+import glob
+import os
+import sys
+import time
+import numpy as np
 ARITY = 3  # the branching factor of the d-Heaps
 
 #=======================================================================
@@ -22,7 +26,7 @@ class HeapItem(object):
 def makeheap(S):
     """Create a heap from set S, which should be a list of pairs (key, item)."""
     heap = list(HeapItem(k,i) for k,i in S)
-    for pos in xrange(len(heap)-1, -1, -1):
+    for pos in range(len(heap)-1, -1, -1):
         siftdown(heap[pos], pos, heap)
     return heap
 
@@ -77,11 +81,11 @@ def siftdown(hi, pos, heap):
 def parent(pos):
     """Return the position of the parent of pos"""
     if pos == 0: return None
-    return int(math.ceil(pos / ARITY) - 1)
+    return (pos - 1) // ARITY
 
 def children(pos, heap):
     """Return a list of children of pos"""
-    return xrange(ARITY * pos + 1, min(ARITY * (pos + 1) + 1, len(heap)))
+    return range(ARITY * pos + 1, min(ARITY * (pos + 1) + 1, len(heap)))
 
 def minchild(pos, heap):
     """Return the child of pos with the smallest key"""
@@ -95,57 +99,122 @@ def minchild(pos, heap):
 # UNION FIND FOR KRUSKAL'S
 #===============================================================================
 
-class ArrayUnionFind:
-    """Holds the three "arrays" for union find"""
-    def __init__(self, S):
-        self.group = dict((s,s) for s in S) # group[s] = id of its set
-        self.size = dict((s,1) for s in S) # size[s] = size of set s
-        self.items = dict((s,[s]) for s in S) # item[s] = list of items in set s
-        
-def make_union_find(S):
-    """Create a union-find data structure"""
-    return ArrayUnionFind(S)
-    
+class UnionFind(object):
+    """Union-find over the items 0..n-1 with union by rank and path compression"""
+    def __init__(self, n):
+        # plain lists: find and union touch one item at a time, which lists do faster than NumPy arrays
+        self.parent = list(range(n)) # parent[s] = parent of s, roots point to themselves
+        self.rank = [0]*n # rank[s] = upper bound on the height of the tree of root s
+
+def make_union_find(n):
+    """Create a union-find data structure for n items"""
+    return UnionFind(n)
+
 def find(UF, s):
-    """Return the id for the group containing s"""
-    return UF.group[s]
-
-def union(UF, a,b):
-    """Union the two sets a and b"""
-    assert a in UF.items and b in UF.items
-    # make a be the smaller set
-    if UF.size[a] > UF.size[b]:
-        a,b = b,a
-    # put the items in a into the larger set b
-    for s in UF.items[a]:
-        UF.group[s] = b
-        UF.items[b].append(s)
-    # the new size of b is increased by the size of a
-    UF.size[b] += UF.size[a]
-    # remove the set a (to save memory)
-    del UF.size[a]
-    del UF.items[a]
+    """Return the id (root) of the group containing s, pointing every item on the way at the root"""
+    parent = UF.parent
+    root = s
+    while parent[root] != root:
+        root = parent[root]
+    while parent[s] != root:
+        parent[s], s = root, parent[s]
+    return root
 
+def union(UF, a, b):
+    """Union the two sets with roots a and b, hanging the lower ranked tree under the other"""
+    if UF.rank[a] > UF.rank[b]:
+        a, b = b, a
+    UF.parent[a] = b
+    if UF.rank[a] == UF.rank[b]:
+        UF.rank[b] += 1
 
-def kruskal_mst(G):
-    """Return a minimum spanning tree using kruskal's algorithm"""
-    # sort the list of edges in G by their length
-    Edges = [(u, v, G[u][v]['weight']) for u,v in G.edges()]
-    Edges.sort(cmp=lambda x,y: cmp(x[2],y[2]))
+def graph_edges(G):
+    """Node list and (u index, v index, weight) edge arrays of a networkx graph"""
+    nodes = list(G.nodes())
+    index = dict((node, i) for i, node in enumerate(nodes))
+    edges = np.array([(index[u], index[v], d.get('weight', 1)) for u, v, d in G.edges(data=True)], dtype=float).reshape(-1, 3)
+    return nodes, edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64), edges[:, 2]
 
-    UF = make_union_find(G.nodes())  # union-find data structure
+def kruskal_edges(n, us, vs, weights):
+    """Kruskal's algorithm over edge arrays: one NumPy argsort of the weights, then union-find
 
+    Returns:
+        np.ndarray: indices of the mst edges in the input arrays
+    """
+    UF = make_union_find(n)
+    mst = []
     # for edges in increasing weight
-    mst = [] # list of edges in the mst
-    for u,v,d in Edges:
-        setu = find(UF, u)
-        setv = find(UF, v)
+    for e in np.argsort(weights, kind='stable').tolist():
+        setu = find(UF, us[e])
+        setv = find(UF, vs[e])
         # if u,v are in different components
         if setu != setv:
-            mst.append((u,v))
+            mst.append(e)
             union(UF, setu, setv)
+            if len(mst) == n - 1:
+                break
+    return np.array(mst, dtype=np.int64)
+
+def kruskal_mst(G):
+    """Return a minimum spanning tree using kruskal's algorithm"""
+    nodes, us, vs, weights = graph_edges(G)
+    mst = kruskal_edges(len(nodes), us.tolist(), vs.tolist(), weights)
+    return [(nodes[us[e]], nodes[vs[e]]) for e in mst.tolist()]
+
+def prim_mst(D):
+    """Return a minimum spanning tree of a dense distance matrix using Prim's algorithm on the d-heap:
+    every node starts in the heap with an infinite key and keys only ever go down through heap_decreasekey
+
+    Arguments:
+        D {np.ndarray} -- (n, n) symmetric distance matrix, np.inf for missing edges
+
+    Returns:
+        list -- (u, v) index pairs of the mst edges
+    """
+    n = len(D)
+    if n == 0:
+        return []
+    heap = makeheap([(0.0 if i == 0 else float('inf'), i) for i in range(n)])
+    items = dict((hi.item, hi) for hi in heap)
+    best_edge = [None]*n
+    mst = []
+    while heap:
+        hi = deletemin(heap)
+        u = hi.item
+        del items[u]
+        if best_edge[u] is not None:
+            mst.append((best_edge[u], u))
+        row = D[u]
+        for v, hv in items.items():
+            if row[v] < hv.key:
+                heap_decreasekey(hv, row[v], heap)
+                best_edge[v] = u
     return mst
 
+def dense_mst_cost(D, nodes=None):
+    """Return the cost of a minimum spanning tree of the given nodes of a dense distance matrix, by Prim's
+    algorithm with the distances to the tree kept in one array: k - 1 vectorized passes over a k x k submatrix
+
+    Arguments:
+        D {np.ndarray} -- (n, n) symmetric distance matrix, np.inf for missing edges
+        nodes {np.ndarray} -- indices of the nodes to span (default: {all})
+    """
+    sub = D if nodes is None else D[np.ix_(nodes, nodes)]
+    k = len(sub)
+    if k < 2:
+        return 0.0
+    in_tree = np.zeros(k, dtype=bool)
+    in_tree[0] = True
+    dist = sub[0].copy()
+    dist[0] = np.inf
+    cost = 0.0
+    for _ in range(k - 1):
+        v = dist.argmin()
+        cost += dist[v]
+        in_tree[v] = True
+        np.minimum(dist, sub[v], out=dist)
+        dist[in_tree] = np.inf
+    return float(cost)
 
 def heuristic(G):
     mst = kruskal_mst(G)
@@ -153,4 +222,37 @@ def heuristic(G):
     for (x,y) in mst:
         wt = G[x][y]['weight']
         mst_cost = mst_cost+wt
-    return mst_cost
\ No newline at end of file
+    return mst_cost
+
+def benchmark(paths, repeat=3):
+    """Times kruskal_mst, Kruskal on the edge arrays and Prim on the dense matrix for every graph
+
+    Returns:
+        list -- (graph, nodes, edges, mst cost, kruskal_mst s, kruskal_edges s, prim_mst s) rows, best of repeat runs
+    """
+    import networkx as nx
+    rows = []
+    for path in paths:
+        G = nx.read_gexf(path)
+        nodes, us, vs, weights = graph_edges(G)
+        D = np.full((len(nodes), len(nodes)), np.inf)
+        D[us, vs] = D[vs, us] = weights
+        timings = []
+        for method in (lambda: kruskal_mst(G), lambda: kruskal_edges(len(nodes), us.tolist(), vs.tolist(), weights), lambda: prim_mst(D)):
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                method()
+                best = min(best, time.perf_counter() - started)
+            timings.append(best)
+        costs = [heuristic(G), weights[kruskal_edges(len(nodes), us.tolist(), vs.tolist(), weights)].sum(), sum(D[u, v] for u, v in prim_mst(D))]
+        assert np.allclose(costs, costs[0]), "MST costs differ on {p}: {c}".format(p=path, c=costs)
+        rows.append((os.path.basename(path), len(nodes), len(weights), costs[0]) + tuple(timings))
+    return rows
+
+if __name__ == '__main__':
+    data = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+    paths = sorted(glob.glob(os.path.join(data, '*.gexf')), key=lambda p: (len(p), p)) if os.path.isdir(data) else sys.argv[1:]
+    print("%-12s %6s %7s %12s %14s %16s %10s" % ("graph", "nodes", "edges", "mst cost", "kruskal_mst s", "kruskal_edges s", "prim_mst s"))
+    for row in benchmark(paths):
+        print("%-12s %6d %7d %12.4f %14.6f %16.6f %10.6f" % row)
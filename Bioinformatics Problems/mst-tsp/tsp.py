@@ -3,50 +3,386 @@ Created on Mar 16, 2013
 
 @author: Prateek
 '''
-import networkx as nx
+import argparse
+import functools
+import glob
+import multiprocessing
+import os
+import time
+from xml.etree import ElementTree
+import numpy as np
 import mst
-import sys
+
+CACHE_SIZE = 1 << 16  # MST costs kept by MSTHeuristic
+MAX_STATES = 5000000  # search states kept in memory by astar_tour before it gives up on proving optimality
+EPS = 1e-9
+STARTS = 64  # local searches run by multistart_tour
+
 #===============================================================================
 # INITIALIZATIONS
 #===============================================================================
-fil = sys.argv[1]
-G = nx.read_gexf(fil)
-nodes = G.nodes()
-start = sorted(G.nodes())[0]
-tour = [start]
-source = start
-cost = 0
-S = []
-fx = 0
-hx = 0 
-gx = 0
-#===============================================================================
-# LET THE SALESMAN TRAVEL!
-#===============================================================================
-while len(tour) != len(nodes):
-    for i in G.neighbors(start):
-        if i in tour:
+def load_graph(fil, cache=True):
+    """Read a gexf graph into its node names and a dense distance matrix (np.inf for missing edges).
+    The matrix is cached as <fil>.npz and read back from there while the gexf's mtime is unchanged,
+    so the XML is only parsed again when the graph changes.
+
+    Returns:
+        tuple: (node names, (n, n) distance matrix)
+    """
+    cache_file = fil + ".npz"
+    mtime = os.path.getmtime(fil)
+    if cache and os.path.exists(cache_file):
+        with np.load(cache_file) as cached:
+            if cached["mtime"] == mtime:
+                return cached["nodes"].tolist(), cached["D"]
+    nodes, D = read_gexf_matrix(fil)
+    if cache:
+        try:
+            with open(cache_file, "wb") as f:
+                np.savez(f, nodes=np.array(nodes), D=D, mtime=mtime)
+        except OSError:
+            pass
+    return nodes, D
+
+def read_gexf_matrix(fil):
+    """Stream the nodes and edge weights out of a gexf file (no networkx graph is built) into a dense
+    distance matrix; undirected graphs get both directions, edges without a weight weigh 1"""
+    nodes, index = [], {}
+    sources, targets, weights = [], [], []
+    directed = False
+    for event, elem in ElementTree.iterparse(fil, events=("start", "end")):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if event == "start":
+            if tag == "graph":
+                directed = elem.get("defaultedgetype") == "directed"
             continue
-        diff = set(tour) - set(source)
-        setdiff = set(nodes)-diff
-        #------- Subgraph fed to form MST for heuristic
-        subG = G.subgraph(list(setdiff))
-        hx = mst.heuristic(subG)
-        gx = G[start][i]['weight']
-        fx = gx+hx
-        S.append((fx,i))
+        if tag == "node":
+            index[elem.get("id")] = len(nodes)
+            nodes.append(elem.get("id"))
+            elem.clear()
+        elif tag == "edge":
+            sources.append(elem.get("source"))
+            targets.append(elem.get("target"))
+            weights.append(float(elem.get("weight", 1.0)))
+            elem.clear()
+    us = np.array([index[u] for u in sources], dtype=np.int64)
+    vs = np.array([index[v] for v in targets], dtype=np.int64)
+    D = np.full((len(nodes), len(nodes)), np.inf)
+    D[us, vs] = weights
+    if not directed:
+        D[vs, us] = weights
+    return nodes, D
+
+def mask_nodes(mask, n):
+    """Indices of the bits set in a node bitmask"""
+    bits = np.frombuffer(mask.to_bytes((n + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(bits, bitorder='little')[:n])
+
+def nodes_mask(nodes):
+    """Bitmask of node indices"""
+    return functools.reduce(lambda mask, node: mask | (1 << int(node)), nodes, 0)
+
+class MSTHeuristic(object):
+    """MST cost of a set of nodes of the distance matrix, memoized with LRU eviction on the bitmask of the set"""
+    def __init__(self, D, maxsize=CACHE_SIZE):
+        self.D = D
+        self.cost = functools.lru_cache(maxsize=maxsize)(self._cost)
+
+    def _cost(self, mask):
+        return mst.dense_mst_cost(self.D, mask_nodes(mask, len(self.D)))
+
+    def __call__(self, mask):
+        return self.cost(mask)
+
 #===============================================================================
-# S now contains all the (key,item) pairs thrown into heap
+# LET THE SALESMAN TRAVEL!
 #===============================================================================
-    H = mst.makeheap(S)
-    S = []
-    low = mst.deletemin(H)
-    #----------------------------------- Extracting the node with the lowest key
-    cur = low.item
-    cost = cost+G[start][cur]['weight']
-    tour.append(cur)
-    start = cur
-end = tour[-1]
-cost = cost + G[source][end]['weight']
-print "Tour: ",' '.join(tour)
-print "Cost: ", cost
\ No newline at end of file
+def greedy_tour(D, source=0, heuristic=None):
+    """Greedy MST guided tour: from the current node, move to the unvisited neighbor with the lowest
+    f(x) = g(x) + h(x), g being the edge weight and h the MST cost of the unvisited nodes plus the source.
+    h is the same for every neighbor of a step, so it is looked up once per step.
+
+    Returns:
+        tuple: (tour as node indices, cost of the closed tour)
+    """
+    heuristic = heuristic or MSTHeuristic(D)
+    n = len(D)
+    tour = [source]
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[source] = False
+    remaining = nodes_mask(range(n))
+    start = source
+    cost = 0
+    while len(tour) != n:
+        hx = heuristic(remaining)
+        fx = np.where(unvisited, D[start] + hx, np.inf)
+        cur = int(fx.argmin())
+        #----------------------------------- Extracting the node with the lowest key
+        cost = cost + D[start, cur]
+        tour.append(cur)
+        unvisited[cur] = False
+        remaining &= ~(1 << cur)
+        start = cur
+    cost = cost + D[source, tour[-1]]
+    return tour, float(cost)
+
+def tour_cost(D, tour):
+    """Cost of the closed tour"""
+    tour = np.asarray(tour)
+    return float(D[tour, np.roll(tour, -1)].sum())
+
+def two_opt(D, tour):
+    """2-opt local search: every pass evaluates the delta of all (i, j) edge pairs at once as an n x n array
+    and applies the best improving reversal, until no reversal improves the tour. tour[0] stays in place.
+
+    Returns:
+        list: improved tour
+    """
+    tour = np.array(tour)
+    n = len(tour)
+    if n < 4:
+        return tour.tolist()
+    while True:
+        nxt = np.roll(tour, -1)
+        edges = D[tour, nxt]
+        # replacing edges (t[i], t[i+1]) and (t[j], t[j+1]) with (t[i], t[j]) and (t[i+1], t[j+1])
+        delta = D[tour[:, None], tour[None, :]] + D[nxt[:, None], nxt[None, :]] - edges[:, None] - edges[None, :]
+        delta = np.triu(delta, 2)
+        delta[0, n - 1] = 0
+        i, j = np.unravel_index(delta.argmin(), delta.shape)
+        if delta[i, j] >= -EPS:
+            return tour.tolist()
+        tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1].copy()
+
+def astar_tour(D, source=0, heuristic=None, upper_bound=None, max_states=MAX_STATES, time_limit=None):
+    """A* / branch-and-bound search over partial tours. A state is (current node, bitmask of visited nodes);
+    f = g + h with h the MST cost of the unvisited nodes plus the current node and the source, a lower bound
+    on any completion. All states wait in one persistent d-heap open list, whose keys are lowered with
+    heap_decreasekey when a cheaper path to a queued state is found. Children that cannot beat the incumbent
+    (the 2-opt improved greedy tour unless an upper bound is given) are never queued, and the search stops
+    as soon as the smallest f left is no better than the incumbent, which is then optimal.
+
+    Arguments:
+        D {np.ndarray} -- (n, n) distance matrix
+        source {int} -- node the tour starts from (default: {0})
+        heuristic {MSTHeuristic} -- memoized MST costs (default: {a new MSTHeuristic(D)})
+        upper_bound {tuple} -- (tour, cost) incumbent to start from (default: {2-opt of the greedy tour})
+        max_states {int} -- search states kept in memory before giving up (default: {MAX_STATES})
+        time_limit {float} -- seconds before giving up (default: {None})
+
+    Returns:
+        tuple -- (tour, cost, stats) with stats holding expanded, generated, states, seconds, nodes_per_sec and
+        optimal (False if a limit stopped the search, the tour is then the best one found)
+    """
+    heuristic = heuristic or MSTHeuristic(D)
+    n = len(D)
+    if upper_bound is None:
+        best_tour = two_opt(D, greedy_tour(D, source, heuristic)[0])
+        upper_bound = (best_tour, tour_cost(D, best_tour))
+    best_tour, best_cost = upper_bound
+    full = (1 << n) - 1
+    source_bit = 1 << source
+    start_state = (source, source_bit)
+    g = {start_state: 0.0}
+    parents = {start_state: None}
+    open_heap = []
+    items = {start_state: mst.heapinsert(heuristic(full), start_state, open_heap)}
+    expanded = generated = 0
+    optimal = True
+    started = time.perf_counter()
+    while open_heap:
+        hi = mst.deletemin(open_heap)
+        state = hi.item
+        del items[state]
+        if hi.key >= best_cost - EPS:
+            break
+        if len(g) > max_states or (time_limit and time.perf_counter() - started > time_limit):
+            optimal = False
+            break
+        expanded += 1
+        cur, visited = state
+        g_cur = g[state]
+        for v in mask_nodes(full & ~visited, n).tolist():
+            child_g = g_cur + D[cur, v]
+            child_visited = visited | (1 << v)
+            generated += 1
+            if child_visited == full:
+                total = child_g + D[v, source]
+                if total < best_cost - EPS:
+                    best_cost = float(total)
+                    best_tour = state_path(parents, state) + [v]
+                continue
+            f = child_g + heuristic((full & ~child_visited) | (1 << v) | source_bit)
+            if f >= best_cost - EPS:
+                continue
+            child = (v, child_visited)
+            if child in g and g[child] <= child_g:
+                continue
+            g[child] = child_g
+            parents[child] = state
+            if child in items:
+                mst.heap_decreasekey(items[child], f, open_heap)
+            else:
+                items[child] = mst.heapinsert(f, child, open_heap)
+    seconds = time.perf_counter() - started
+    stats = {'expanded': expanded, 'generated': generated, 'states': len(g), 'seconds': seconds,
+             'nodes_per_sec': expanded / seconds if seconds else 0.0, 'optimal': optimal}
+    return list(best_tour), float(best_cost), stats
+
+def state_path(parents, state):
+    """Nodes of the partial tour that led to state"""
+    path = []
+    while state is not None:
+        path.append(state[0])
+        state = parents[state]
+    return path[::-1]
+
+def or_opt(D, tour, max_segment=3):
+    """Best Or-opt move: relocate a segment of 1 to max_segment nodes (possibly reversed) between two other
+    neighbouring nodes. For every segment length the deltas of all (segment, insertion edge) pairs are
+    evaluated at once as an n x n array. tour[0] stays in place.
+
+    Returns:
+        tuple: (tour after the best improving move, True) or (tour, False) if no move improves it
+    """
+    tour = np.asarray(tour)
+    n = len(tour)
+    best = (-EPS, None)
+    nxt = np.roll(tour, -1)
+    positions = np.arange(n)
+    for length in range(1, min(max_segment, n - 3) + 1):
+        # segments tour[i:i+length] for i in 1..n-length, between prev = tour[i-1] and after = tour[(i+length) % n]
+        i = np.arange(1, n - length + 1)
+        first, last = tour[i], tour[i + length - 1]
+        prev, after = tour[i - 1], tour[(i + length) % n]
+        removal_gain = D[prev, first] + D[last, after] - D[prev, after]
+        # insertion into edge (tour[j], tour[j+1]), forward or reversed
+        forward = D[tour[None, :], first[:, None]] + D[last[:, None], nxt[None, :]]
+        backward = D[tour[None, :], last[:, None]] + D[first[:, None], nxt[None, :]]
+        delta = np.minimum(forward, backward) - D[tour, nxt][None, :] - removal_gain[:, None]
+        # edges touching the segment are not insertion points
+        delta[(positions[None, :] >= i[:, None] - 1) & (positions[None, :] <= i[:, None] + length - 1)] = np.inf
+        row, j = np.unravel_index(delta.argmin(), delta.shape)
+        if delta[row, j] < best[0]:
+            best = (delta[row, j], (i[row], length, j, forward[row, j] <= backward[row, j]))
+    if best[1] is None:
+        return tour.tolist(), False
+    i, length, j, is_forward = best[1]
+    segment = tour[i:i + length].tolist()
+    rest = tour.tolist()
+    del rest[i:i + length]
+    insert_at = j + 1 if j < i else j + 1 - length
+    rest[insert_at:insert_at] = segment if is_forward else segment[::-1]
+    return rest, True
+
+def local_search(D, tour):
+    """2-opt to a local optimum, then Or-opt moves, until neither improves the tour"""
+    improved = True
+    while improved:
+        tour = two_opt(D, tour)
+        tour, improved = or_opt(D, tour)
+    return tour
+
+def randomized_nearest_neighbor(D, source, rng, candidates=2, start=None):
+    """Nearest neighbor tour from a random node (or start), stepping to one of the candidates nearest
+    unvisited nodes at random; rotated so that it starts at source"""
+    n = len(D)
+    cur = int(rng.integers(n)) if start is None else start
+    tour = [cur]
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[cur] = False
+    for step in range(n - 1, 0, -1):
+        dist = np.where(unvisited, D[cur], np.inf)
+        k = min(candidates, step)
+        nearest = np.argpartition(dist, k - 1)[:k]
+        cur = int(nearest[rng.integers(k)])
+        tour.append(cur)
+        unvisited[cur] = False
+    at = tour.index(source)
+    return tour[at:] + tour[:at]
+
+## Distance matrix of the worker processes, set once per worker by _init_worker
+_worker_D = None
+
+def _init_worker(D):
+    """Pool initializer: keeps the distance matrix in the worker instead of pickling it per start"""
+    global _worker_D
+    _worker_D = D
+
+def _local_search_task(task):
+    """Pool task: one nearest neighbor + local search run. Start 0 is the plain nearest neighbor tour from
+    the source, the other even starts plain nearest neighbor tours from random nodes and the odd ones randomized"""
+    start, seed, source = task
+    rng = np.random.default_rng(seed)
+    tour = randomized_nearest_neighbor(_worker_D, source, rng, candidates=1 + start % 2, start=source if start == 0 else None)
+    tour = local_search(_worker_D, tour)
+    return tour, tour_cost(_worker_D, tour)
+
+def multistart_tour(D, source=0, starts=STARTS, workers=1, seed=0):
+    """Heuristic tour for graphs too large for astar_tour: many randomized nearest neighbor tours improved by
+    2-opt and Or-opt, run on a process pool that receives the distance matrix once per worker
+
+    Returns:
+        tuple: (best tour, its cost)
+    """
+    tasks = [(start, seed + start, source) for start in range(starts)]
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(D,)) as pool:
+            results = pool.map(_local_search_task, tasks)
+    else:
+        _init_worker(D)
+        results = list(map(_local_search_task, tasks))
+    return min(results, key=lambda result: result[1])
+
+def benchmark(paths, starts=STARTS, workers=1):
+    """Greedy MST guided tour against multistart_tour on every graph
+
+    Returns:
+        list: (graph, nodes, greedy cost, greedy s, multistart cost, multistart s) rows
+    """
+    rows = []
+    for path in paths:
+        nodes, D = load_graph(path)
+        source = nodes.index(sorted(nodes)[0])
+        started = time.perf_counter()
+        greedy_cost = greedy_tour(D, source=source)[1]
+        greedy_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        multistart_cost = multistart_tour(D, source=source, starts=starts, workers=workers)[1]
+        rows.append((os.path.basename(path), len(nodes), greedy_cost, greedy_seconds, multistart_cost, time.perf_counter() - started))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="MST guided travelling salesman tour of a gexf graph")
+    parser.add_argument("gexf", help="Graph with edge weights, or a directory of them with --benchmark")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="MST costs kept in the LRU cache")
+    parser.add_argument("--exact", action="store_true", help="A* search for the optimal tour instead of the greedy tour")
+    parser.add_argument("--max-states", type=int, default=MAX_STATES, help="Search states kept in memory by --exact")
+    parser.add_argument("--time-limit", type=float, help="Seconds before --exact gives up and prints the best tour found")
+    parser.add_argument("--heuristic", action="store_true", help="Multi-start 2-opt/Or-opt local search instead of the greedy tour")
+    parser.add_argument("--starts", type=int, default=STARTS, help="Local searches run by --heuristic")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(), help="Worker processes for --heuristic")
+    parser.add_argument("--benchmark", action="store_true", help="Compare the greedy and --heuristic tours on every graph of a directory")
+    args = parser.parse_args()
+    if args.benchmark:
+        paths = sorted(glob.glob(os.path.join(args.gexf, '*.gexf')), key=lambda p: (len(p), p))
+        print("%-12s %6s %12s %10s %16s %14s" % ("graph", "nodes", "greedy cost", "greedy s", "multistart cost", "multistart s"))
+        for row in benchmark(paths, starts=args.starts, workers=args.workers):
+            print("%-12s %6d %12.4f %10.4f %16.4f %14.4f" % row)
+        return
+    nodes, D = load_graph(args.gexf)
+    heuristic = MSTHeuristic(D, maxsize=args.cache_size)
+    source = nodes.index(sorted(nodes)[0])
+    if args.exact:
+        tour, cost, stats = astar_tour(D, source=source, heuristic=heuristic, max_states=args.max_states, time_limit=args.time_limit)
+        print("Expanded %d nodes in %.2fs (%.0f nodes/s), %s" % (stats['expanded'], stats['seconds'], stats['nodes_per_sec'],
+                                                                  "optimal" if stats['optimal'] else "stopped at a limit, best tour found"))
+    elif args.heuristic:
+        tour, cost = multistart_tour(D, source=source, starts=args.starts, workers=args.workers)
+    else:
+        tour, cost = greedy_tour(D, source=source, heuristic=heuristic)
+    print("Tour: ", ' '.join(nodes[i] for i in tour))
+    print("Cost: ", cost)
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,138 @@
 from __future__ import print_function
-from Bio import Entrez
 from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.Data import CodonTable
+from io import StringIO
 import re
 import os
+import sys
+import argparse
+import hashlib
+import multiprocessing
+import numpy as np
+import pandas as pd
+import sqlite3
+import urllib.parse
+import urllib.request
 
-def fetch_sequence(refseqid):
-    """Communicates through the NCBI Entrez API to fetch the id corresponding 
-    to the refseq id so as the fetch the CDS for the purpose of the task"""
-    Entrez.email = "prateektandon@cmu.edu"
-    handle = Entrez.esearch(db="nucleotide", term=refseqid)
-    info = Entrez.read(handle)
-    # checks if it succeeds
-    if not info:
-        print("Fetching did not succeed")
-        return None
-    seq_id = info['IdList'][0]
-    handle = Entrez.efetch(db="nuccore", id=seq_id, rettype="fasta_cds_na", retmode="text")
-    # check if it succeeds
-    record = handle.read()
-    if not record:
-        print("Could not fetch the CDS")
-        return None
-    # writing the fasta file to be easily parsed while reading by the SeqIO module
+EMAIL = "prateektandon@cmu.edu"
+# E-utilities endpoint, overridable so tests can point at a local stub server
+EUTILS_URL = os.environ.get("EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/")
+CACHE_PATH = os.environ.get("REFSEQ_CACHE", "refseq_cache.sqlite")
+# Never touch the network, only serve sequences from the cache
+OFFLINE = os.environ.get("REFSEQ_OFFLINE", "") not in ("", "0")
+BATCH_SIZE = 200
+# fasta_cds_na headers look like >lcl|NM_000022.2_cds_NP_000013.2_1 [gene=ADA] ...
+CDS_HEADER_REGEX = re.compile(r'^lcl\|(.+?)_cds_')
+
+class SequenceCache(object):
+    """Local CDS store in SQLite keyed by accession.version. Sequences are stored once per content
+    (keyed by their SHA-1), so accessions sharing a CDS share the row."""
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sequences (sha1 TEXT PRIMARY KEY, sequence TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS accessions (accession TEXT PRIMARY KEY, description TEXT,
+                                                   sha1 TEXT NOT NULL REFERENCES sequences(sha1));
+        """)
+
+    def get_many(self, accessions):
+        """Cached sequences of the accessions found, as {accession: (description, sequence)}"""
+        found = {}
+        accessions = list(accessions)
+        # stays under SQLite's limit of host parameters per statement
+        for start in range(0, len(accessions), 500):
+            batch = accessions[start:start+500]
+            rows = self.db.execute("SELECT a.accession, a.description, s.sequence FROM accessions a JOIN sequences s "
+                                   "ON a.sha1 = s.sha1 WHERE a.accession IN ({q})".format(q=",".join("?"*len(batch))), batch)
+            found.update((accession, (description, sequence)) for accession, description, sequence in rows)
+        return found
+
+    def put_many(self, records):
+        """Stores {accession: (description, sequence)}"""
+        rows = [(accession, description, sequence, hashlib.sha1(sequence.encode()).hexdigest())
+                for accession, (description, sequence) in records.items()]
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO sequences VALUES (?, ?)", [(sha1, sequence) for _, _, sequence, sha1 in rows])
+            self.db.executemany("INSERT OR REPLACE INTO accessions VALUES (?, ?, ?)", [(accession, description, sha1) for accession, description, _, sha1 in rows])
+
+    def __contains__(self, accession):
+        return self.db.execute("SELECT 1 FROM accessions WHERE accession = ?", (accession,)).fetchone() is not None
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def efetch_cds(accessions, eutils_url=None):
+    """One efetch round trip for a batch of accession ids (no esearch needed for them). Returned
+    records are keyed by the id they were requested with: an unversioned id such as NM_000022
+    gets the record NCBI returns for it (the latest version, e.g. NM_000022.4).
+
+    Returns:
+        dict: {requested accession: (description, sequence)}, first CDS of every accession that was returned
+    """
+    params = urllib.parse.urlencode({"db": "nuccore", "id": ",".join(accessions), "rettype": "fasta_cds_na",
+                                     "retmode": "text", "email": EMAIL}).encode()
+    with urllib.request.urlopen((eutils_url or EUTILS_URL) + "efetch.fcgi", data=params) as response:
+        text = response.read().decode()
+    unversioned = {accession for accession in accessions if '.' not in accession}
+    records = {}
+    for record in SeqIO.parse(StringIO(text), 'fasta'):
+        match = CDS_HEADER_REGEX.match(record.id)
+        accession = match.group(1) if match else record.id
+        for requested in (accession, accession.split('.')[0]):
+            if (requested == accession or requested in unversioned) and requested not in records:
+                records[requested] = (record.description, str(record.seq))
+    return {accession: records[accession] for accession in accessions if accession in records}
+
+def fetch_sequences(refseqids, cache=None, offline=None, batch_size=BATCH_SIZE, eutils_url=None):
+    """Fetches the CDS of many RefSeq ids, serving repeated ids from the local cache and fetching
+    the missing ones with one efetch per batch_size ids. Ids are cached as given, so an unversioned
+    id keeps the version it was first fetched at. In offline mode the network is never used and ids
+    missing from the cache are left out.
+
+    Returns:
+        dict: {refseqid: Seq} for the ids that were found
+    """
+    if cache is None:
+        with SequenceCache() as cache:
+            return fetch_sequences(refseqids, cache=cache, offline=offline, batch_size=batch_size, eutils_url=eutils_url)
+    offline = OFFLINE if offline is None else offline
+    refseqids = list(dict.fromkeys(refseqids))
+    found = cache.get_many(refseqids)
+    missing = [refseqid for refseqid in refseqids if refseqid not in found]
+    if missing and offline:
+        print("Offline mode, not in the cache: {m}".format(m=", ".join(missing)))
+    elif missing:
+        for start in range(0, len(missing), batch_size):
+            fetched = efetch_cds(missing[start:start+batch_size], eutils_url=eutils_url)
+            cache.put_many(fetched)
+            found.update(fetched)
+        not_fetched = [refseqid for refseqid in missing if refseqid not in found]
+        if not_fetched:
+            print("Could not fetch the CDS of: {m}".format(m=", ".join(not_fetched)))
+    return {refseqid: Seq(found[refseqid][1]) for refseqid in refseqids if refseqid in found}
+
+def fetch_sequence(refseqid, cache=None, offline=None):
+    """Gets the CDS of one refseq id through the local cache (see fetch_sequences) and writes it to
+    <refseqid>.fasta for read_fetched, unless that file already exists"""
     fname = refseqid+".fasta"
-    out_handle = open(fname, 'w')
-    out_handle.write(record.rstrip('\n'))
-    out_handle.close()
-    # check if the file was successfully created
-    if not os.path.exists(fname):
-        print("File not created")
+    if os.path.exists(fname):
+        return fname
+    if cache is None:
+        with SequenceCache() as cache:
+            return fetch_sequence(refseqid, cache=cache, offline=offline)
+    if refseqid not in fetch_sequences([refseqid], cache=cache, offline=offline):
         return None
+    description, sequence = cache.get_many([refseqid])[refseqid]
+    with open(fname, 'w') as out_handle:
+        out_handle.write(">{d}\n{s}".format(d=description, s=sequence))
     return fname
 
 def read_fetched(fname):
@@ -80,24 +183,122 @@ def is_valid_pattern(pattern):
         return False
     return True
 
+# Batch substitution engine
+SUBSTITUTION_REGEX = r'^c\.(\d+)([ACGT])>([ACGT])$'
+BASES = "TCAG"
+# 2 bit code per base (anything else is -1) and the amino acid of every 6 bit codon code
+_BASE_CODES = np.full(256, -1, dtype=np.int64)
+_BASE_CODES[np.frombuffer(BASES.encode(), dtype=np.uint8)] = np.arange(4)
+_BASE_CODES[np.frombuffer(BASES.lower().encode(), dtype=np.uint8)] = np.arange(4)
+_standard_table = CodonTable.unambiguous_dna_by_id[1]
+CODON_TABLE = np.array([_standard_table.forward_table.get(a+b+c, '*') for a in BASES for b in BASES for c in BASES])
+_CODON_WEIGHTS = np.array([16, 4, 1])
+MUTATION_COLUMNS = ['transcript','mutation','valid','ref_matches','codon','ref_codon','alt_codon','ref_aa','alt_aa','protein_change','consequence']
+
+def parse_mutations(mutations):
+    """Vectorized is_valid_pattern/mutation_info over many c. substitutions
+
+    Returns:
+        pd.DataFrame: mutation, valid, pos (0 based, -1 if invalid), ref and alt columns
+    """
+    mutations = pd.Series(list(mutations), dtype=object)
+    parsed = mutations.str.extract(SUBSTITUTION_REGEX)
+    valid = parsed[0].notna().to_numpy()
+    return pd.DataFrame({'mutation': mutations, 'valid': valid,
+                         'pos': np.where(valid, pd.to_numeric(parsed[0]).fillna(0).to_numpy(np.int64) - 1, -1),
+                         'ref': parsed[1].fillna(''), 'alt': parsed[2].fillna('')})
+
+def codon_codes(cds):
+    """6 bit code of every codon of a CDS (-1 for codons with a base other than ACGT)"""
+    base_codes = _BASE_CODES[np.frombuffer(str(cds).encode(), dtype=np.uint8)]
+    base_codes = base_codes[:len(base_codes)//3*3].reshape(-1, 3)
+    return np.where((base_codes >= 0).all(axis=1), base_codes @ _CODON_WEIGHTS, -1)
+
+def apply_mutations(cds, mutations, transcript=None):
+    """Evaluates many c. substitutions against one CDS at once. The CDS is encoded into codon codes once;
+    every mutation only changes one base of its codon, so the alternative codon is the reference codon code
+    with that base's 2 bit code swapped and both amino acids are lookups in CODON_TABLE. The protein is never
+    translated again.
+
+    Args:
+        cds (str or Seq): Coding sequence, starting at the start codon
+        mutations (list): c. substitutions, e.g. ['c.239A>G']
+        transcript (str, optional): Transcript name for the output. Defaults to None.
+
+    Returns:
+        pd.DataFrame: One row per mutation (MUTATION_COLUMNS). Mutations with an invalid pattern, a position
+        outside the CDS or a reference allele that does not match have empty codon and amino acid columns
+    """
+    cds = str(cds).upper()
+    parsed = parse_mutations(mutations)
+    codons = codon_codes(cds)
+    cds_bases = np.frombuffer(cds.encode(), dtype=np.uint8)
+    pos = parsed['pos'].to_numpy()
+    in_cds = (pos >= 0) & (pos < len(codons)*3)
+    ref_bases = np.full(len(pos), -1, dtype=np.int64)
+    ref_bases[in_cds] = cds_bases[pos[in_cds]]
+    expected = np.frombuffer(''.join(parsed['ref'].replace('', 'N')).encode(), dtype=np.uint8)
+    ref_matches = in_cds & (ref_bases == expected)
+    codon = np.where(ref_matches, pos//3, 0)
+    ref_codes = np.where(ref_matches, codons[codon], -1)
+    ok = ref_matches & (ref_codes >= 0)
+    weights = _CODON_WEIGHTS[pos % 3]
+    alt_base_codes = _BASE_CODES[np.frombuffer(''.join(parsed['alt'].replace('', 'N')).encode(), dtype=np.uint8)]
+    alt_codes = ref_codes + (alt_base_codes - _BASE_CODES[np.maximum(ref_bases, 0)])*weights
+    ref_aa = np.where(ok, CODON_TABLE[np.maximum(ref_codes, 0)], '')
+    alt_aa = np.where(ok, CODON_TABLE[np.clip(alt_codes, 0, 63)], '')
+    codon_strings = np.array([a+b+c for a in BASES for b in BASES for c in BASES])
+    consequence = np.select([~ok, ref_aa == alt_aa, alt_aa == '*', ref_aa == '*'],
+                            ['', 'synonymous', 'nonsense', 'stop_lost'], 'missense')
+    return pd.DataFrame({
+        'transcript': transcript, 'mutation': parsed['mutation'], 'valid': parsed['valid'], 'ref_matches': ref_matches,
+        'codon': np.where(ok, codon + 1, 0), 'ref_codon': np.where(ok, codon_strings[np.maximum(ref_codes, 0)], ''),
+        'alt_codon': np.where(ok, codon_strings[np.clip(alt_codes, 0, 63)], ''), 'ref_aa': ref_aa, 'alt_aa': alt_aa,
+        'protein_change': np.where(ok, np.char.add(np.char.add(ref_aa.astype(str), (codon + 1).astype(str)), alt_aa.astype(str)), ''),
+        'consequence': consequence,
+    }, columns=MUTATION_COLUMNS)
+
+def _apply_mutations_task(task):
+    """Pool task: apply_mutations over the (transcript, cds, mutations) of one transcript"""
+    transcript, cds, mutations = task
+    return apply_mutations(cds, mutations, transcript=transcript)
+
+def apply_mutations_batch(mutations_df, cache=None, offline=None, workers=1):
+    """Evaluates the c. substitutions of many transcripts. The CDS of every transcript is fetched once
+    through the sequence cache and the transcripts are processed on a process pool.
+
+    Args:
+        mutations_df (pd.DataFrame): transcript (RefSeq accession, see fetch_sequences) and mutation columns
+        workers (int, optional): Worker processes. Defaults to 1.
+
+    Returns:
+        pd.DataFrame: apply_mutations rows of every transcript whose CDS was found
+    """
+    groups = mutations_df.groupby('transcript', sort=False)['mutation']
+    sequences = fetch_sequences(list(groups.groups), cache=cache, offline=offline)
+    tasks = [(transcript, str(sequences[transcript]), mutations.tolist()) for transcript, mutations in groups if transcript in sequences]
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_apply_mutations_task, tasks, chunksize=max(1, len(tasks)//(workers*4)))
+    else:
+        results = list(map(_apply_mutations_task, tasks))
+    if not results:
+        return pd.DataFrame(columns=MUTATION_COLUMNS)
+    return pd.concat(results, ignore_index=True)
+
 def main():
-    mutation = 'c.239A>G'
-    refseqid = "NM_000022.2"
-    # If internet communication needs to be omitted, change the following line to be 
-    # fname = "Name.fasta" where Name is the actual filename
-    # Rest everything should work just fine
-    fname = fetch_sequence(refseqid)
-    cds = read_fetched(fname)
-    wildtype,mutatedtype,pos = mutation_info(mutation)
-    # mutating the sequence in the required position
-    cds_mutated = cds.tomutable()
-    if cds_mutated[pos] == wildtype:
-        cds_mutated[pos] = mutatedtype
+    parser = argparse.ArgumentParser(description="Codon and amino acid changes of c. substitutions")
+    parser.add_argument("-i", "--input", help="TSV of transcript (accession.version) and c. mutation, without header")
+    parser.add_argument("-o", "--output", default="-", help="Output table, - for stdout")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--offline", action="store_true", help="Only use the local sequence cache")
+    args = parser.parse_args()
+    if args.input:
+        mutations_df = pd.read_csv(args.input, sep="\t", header=None, names=['transcript','mutation'], dtype=str)
     else:
-        print("The original allele does not occur at the position specified")
-    cds_mutated = cds_mutated.toseq()
-    cds_protein = str(cds_mutated.translate())
-    print(cds_protein)
+        mutations_df = pd.DataFrame({'transcript': ["NM_000022.2"], 'mutation': ['c.239A>G']})
+    result = apply_mutations_batch(mutations_df, offline=args.offline or None, workers=args.workers)
+    result.to_csv(sys.stdout if args.output == '-' else args.output, sep="\t", index=False)
 
 if __name__ == '__main__':
     main()
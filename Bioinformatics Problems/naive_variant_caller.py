@@ -12,11 +12,56 @@ If more than 1 Alt allele is present, the variant call should contain all of the
 
 The call_variants function takes a min_depth argument; if the total read depth is less than this, 
 the position is "nocall"
+
+call_variants_batch makes the same calls from a (positions x alleles) count matrix using NumPy,
+and call_pileup_file streams an mpileup file through it in chunks. With genotype=True the base
+qualities of the pileup are used instead to compute biallelic genotype likelihoods (GL/PL, GQ, QUAL).
 """
 
 ## Imports
 from __future__ import print_function
 from collections import Counter
+from io import StringIO
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pysam
+
+from pileup_utils import read_pileup_chunks, strip_pileup_markers
+from utils import setup_logger, imap_bounded
+from VCFwriter import VCFwriter
+
+logger = logging.getLogger(__name__)
+
+## Alt alleles in the column order of the count matrices
+ALLELES = 'ACGT'
+HOM_THRESHOLD = 75
+LOW_THRESHOLD = 25
+MIN_DEPTH = 5
+REGION_SIZE = 1000000
+## Genotype likelihood mode: biallelic genotypes in VCF PL order with their prior probabilities
+GENOTYPES = [(0, 0), (0, 1), (1, 1)]
+GENOTYPE_PRIORS = np.array([1-1.5e-3, 1e-3, 5e-4])
+MIN_BASE_QUALITY = 13
+MIN_QUAL = 20
+MAX_GQ = 99
+## Phred quality (ASCII - 33) -> probability of a base call error
+_ERROR_PROBABILITY = 10**(-np.clip(np.arange(256) - 33, 0, None)/10.)
+NO_ALLELE, LOW, HET, HOM = 0, 1, 2, 3
+_SUFFIXES = ['', 'low', 'het', 'hom']
+## Columns of calls_to_vcf_records outside genotype likelihood mode
+VCF_COLUMNS = ['#CHROM', 'POS', 'REF', 'ALT', 'GT', 'FILTER']
+_CALL_LABELS = [[allele+" "+suffix if suffix else '' for suffix in _SUFFIXES] for allele in ALLELES]
+## Byte -> count matrix column: A,C,G,T (either case) map to 0-3, everything else to 4
+_ALLELE_COLUMN = np.full(256, len(ALLELES), dtype=np.uint8)
+for _col, _allele in enumerate(ALLELES):
+    _ALLELE_COLUMN[ord(_allele)] = _col
+    _ALLELE_COLUMN[ord(_allele.lower())] = _col
 
 ## Inputs
 test_ref = 'TTTAGAGCGC'
@@ -76,10 +121,389 @@ def call_variants(pileup, ref, min_depth):
         call_set.append(','.join(pileup_call.values()))
     return call_set
 
+def count_alleles(pileup):
+    """Counts the alt alleles of every pileup string in one pass over a byte view of the
+    concatenated strings.
+
+    Args:
+        pileup (list): Pileup strings, one per position
+
+    Returns:
+        tuple: (depth, counts, first_seen) where depth is the length of each pileup string,
+        counts is a (positions x 4) array of A,C,G,T counts and first_seen holds the offset of the
+        first read carrying each allele (len(ALLELES) past the end if absent), used to order the calls
+        the way call_variants lists them.
+    """
+    n = len(pileup)
+    depth = np.fromiter(map(len, pileup), dtype=np.int64, count=n)
+    ncols = len(ALLELES) + 1
+    if depth.sum() == 0:
+        return depth, np.zeros((n, len(ALLELES)), dtype=np.int64), np.zeros((n, len(ALLELES)), dtype=np.int64)
+    bases = np.frombuffer(''.join(pileup).encode('ascii', 'replace'), dtype=np.uint8)
+    columns = _ALLELE_COLUMN[bases]
+    is_alt = np.flatnonzero(columns < len(ALLELES))
+    rows = np.repeat(np.arange(n), depth)[is_alt]
+    keys = rows*ncols + columns[is_alt].astype(np.int64)
+    counts = np.bincount(keys, minlength=n*ncols).reshape(n, ncols)[:, :len(ALLELES)]
+    ## np.unique returns the index of the first occurrence of each (position, allele) key
+    unique_keys, first_index = np.unique(keys, return_index=True)
+    offsets = np.concatenate(([0], np.cumsum(depth)[:-1]))
+    first_seen = np.full(n*ncols, np.iinfo(np.int64).max, dtype=np.int64)
+    first_seen[unique_keys] = is_alt[first_index] - offsets[unique_keys // ncols]
+    return depth, counts, first_seen.reshape(n, ncols)[:, :len(ALLELES)]
+
+def classify_counts(depth, counts, hom_threshold=HOM_THRESHOLD, low_threshold=LOW_THRESHOLD):
+    """Applies the hom/het/low percentage rules to a whole count matrix at once.
+
+    Args:
+        depth (numpy.ndarray): Read depth per position
+        counts (numpy.ndarray): (positions x alleles) alt allele counts
+        hom_threshold (int, optional): Alleles above this percentage are "hom". Defaults to 75.
+        low_threshold (int, optional): Alleles below this percentage are "low". Defaults to 25.
+
+    Returns:
+        numpy.ndarray: (positions x alleles) matrix of NO_ALLELE/LOW/HET/HOM codes
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = counts*100/depth[:, None]
+    return np.select([counts == 0, percent > hom_threshold, percent >= low_threshold],
+                     [NO_ALLELE, HOM, HET], default=LOW)
+
+def call_variants_from_counts(depth, counts, min_depth, first_seen=None,
+                              hom_threshold=HOM_THRESHOLD, low_threshold=LOW_THRESHOLD):
+    """Makes the call_variants calls from a (positions x alleles) count matrix.
+
+    Args:
+        depth (numpy.ndarray): Read depth per position
+        counts (numpy.ndarray): (positions x alleles) alt allele counts, columns in ALLELES order
+        min_depth (int): Positions with a lower depth are "nocall"
+        first_seen (numpy.ndarray, optional): Order in which the alleles were seen at each position.
+            Defaults to None, which lists the alleles in ALLELES order.
+        hom_threshold (int, optional): Alleles above this percentage are "hom". Defaults to 75.
+        low_threshold (int, optional): Alleles below this percentage are "low". Defaults to 25.
+
+    Returns:
+        list: Call per position, using the same labels as call_variants
+    """
+    depth = np.asarray(depth)
+    counts = np.asarray(counts)
+    codes = classify_counts(depth, counts, hom_threshold, low_threshold)
+    nocall = depth < min_depth
+    has_alt = (codes != NO_ALLELE).any(axis=1) & ~nocall
+    calls = np.where(nocall, "nocall", "ref").astype(object)
+    variant_rows = np.flatnonzero(has_alt)
+    if variant_rows.size:
+        if first_seen is None:
+            order = np.broadcast_to(np.arange(len(ALLELES)), (variant_rows.size, len(ALLELES)))
+        else:
+            order = np.argsort(first_seen[variant_rows], axis=1, kind='stable')
+        ordered_codes = np.take_along_axis(codes[variant_rows], order, axis=1)
+        ## Only a few hundred (allele order, codes) combinations exist, so each distinct label is built once
+        radix = len(_SUFFIXES) ** np.arange(len(ALLELES))
+        keys = (order*radix).sum(axis=1)*radix[-1]*len(_SUFFIXES) + (ordered_codes*radix).sum(axis=1)
+        unique_keys, first_row, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        labels = np.array([','.join(_CALL_LABELS[a][c] for a, c in zip(order[row], ordered_codes[row]) if c)
+                           for row in first_row], dtype=object)
+        calls[variant_rows] = labels[inverse.ravel()]
+    return calls.tolist()
+
+def call_variants_batch(pileup, ref, min_depth, hom_threshold=HOM_THRESHOLD, low_threshold=LOW_THRESHOLD):
+    """Vectorized equivalent of call_variants for A,C,G,T alt alleles.
+
+    Args:
+        pileup (list): Pileup strings, one per position on ref
+        ref (str): Reference sequence
+        min_depth (int): Positions with a lower depth are "nocall"
+
+    Returns:
+        list: Call per position
+    """
+    depth, counts, first_seen = count_alleles(pileup)
+    return call_variants_from_counts(depth, counts, min_depth, first_seen=first_seen,
+                                     hom_threshold=hom_threshold, low_threshold=low_threshold)
+
+def genotype_likelihoods(pileup, quals, ref, min_base_quality=MIN_BASE_QUALITY):
+    """Computes biallelic (ref / most frequent alt) genotype log10-likelihoods for every site.
+    Each read base contributes log10 P(base | genotype) with the error rate from its base quality;
+    the per-read terms are computed as flat arrays over all the reads of all sites and summed per site.
+
+    Args:
+        pileup (list): Pileup strings with one character per read (see pileup_utils.strip_pileup_markers)
+        quals (list): Base quality strings, same lengths as the pileup strings
+        ref (str or list): Reference base of every site
+        min_base_quality (int, optional): Bases below this quality are ignored. Defaults to 13.
+
+    Returns:
+        tuple: (alt, gl) where alt is the ALLELES index of the alt allele of each site and
+        gl is a (sites x 3) array of log10 likelihoods for the GENOTYPES
+    """
+    n = len(pileup)
+    depth, counts, first_seen = count_alleles(pileup)
+    if not np.array_equal(depth, np.fromiter(map(len, quals), dtype=np.int64, count=n)):
+        raise ValueError("Pileup and quality strings must have the same lengths")
+    ref_column = _ALLELE_COLUMN[np.frombuffer(''.join(ref).encode('ascii', 'replace'), dtype=np.uint8)].astype(np.int64)
+    if ref_column.shape[0] != n:
+        raise ValueError("Expected one reference base per pileup string")
+    alt_counts = counts.copy()
+    known_ref = ref_column < len(ALLELES)
+    alt_counts[known_ref, ref_column[known_ref]] = -1
+    alt = alt_counts.argmax(axis=1)
+    gl = np.zeros((n, len(GENOTYPES)))
+    if depth.sum() == 0:
+        return alt, gl
+
+    bases = np.frombuffer(''.join(pileup).encode('ascii', 'replace'), dtype=np.uint8)
+    qual_bytes = np.frombuffer(''.join(quals).encode('ascii', 'replace'), dtype=np.uint8)
+    rows = np.repeat(np.arange(n), depth)
+    columns = _ALLELE_COLUMN[bases]
+    is_ref = (bases == ord('.')) | (bases == ord(',')) | (columns == ref_column[rows])
+    is_alt = (columns == alt[rows]) & ~is_ref
+    used = np.flatnonzero((is_ref | (columns < len(ALLELES))) & (qual_bytes >= min_base_quality+33))
+    rows, is_ref, is_alt = rows[used], is_ref[used], is_alt[used]
+    error = _ERROR_PROBABILITY[qual_bytes[used]]
+    p_ref = np.where(is_ref, 1-error, error/3)
+    p_alt = np.where(is_alt, 1-error, error/3)
+    for idx, p_read in enumerate([p_ref, (p_ref+p_alt)/2, p_alt]):
+        gl[:, idx] = np.bincount(rows, weights=np.log10(p_read), minlength=n)
+    return alt, gl
+
+def genotype_from_likelihoods(gl, priors=GENOTYPE_PRIORS):
+    """Turns genotype log10-likelihoods into VCF genotype fields, for all sites at once.
+
+    Args:
+        gl (numpy.ndarray): (sites x 3) log10 likelihoods in GENOTYPES order
+        priors (numpy.ndarray, optional): Genotype prior probabilities. Defaults to GENOTYPE_PRIORS.
+
+    Returns:
+        tuple: (gt, pl, gq, qual) arrays. gt indexes GENOTYPES, pl are the phred-scaled likelihoods,
+        gq the difference between the two most likely PLs (capped at MAX_GQ) and qual the phred-scaled
+        posterior probability that the site is homozygous reference.
+    """
+    pl = np.rint(-10*(gl - gl.max(axis=1, keepdims=True))).astype(np.int64)
+    gt = pl.argmin(axis=1)
+    gq = np.minimum(np.sort(pl, axis=1)[:, 1], MAX_GQ)
+    log_posterior = gl + np.log10(priors)
+    top = log_posterior.max(axis=1, keepdims=True)
+    log_total = top[:, 0] + np.log10(np.power(10., log_posterior - top).sum(axis=1))
+    qual = np.round(np.maximum(-10*(log_posterior[:, 0] - log_total), 0), 2)
+    return gt, pl, gq, qual
+
+def call_pileup_file(pileup_file, min_depth, chunksize=100000, hom_threshold=HOM_THRESHOLD,
+                     low_threshold=LOW_THRESHOLD, genotype=False, min_base_quality=MIN_BASE_QUALITY):
+    """Streams an mpileup file through the vectorized caller, one chunk of positions at a time.
+
+    Args:
+        pileup_file (str or file): Path or handle of the samtools mpileup output
+        min_depth (int): Positions with a lower depth are "nocall"
+        chunksize (int, optional): Number of pileup rows per chunk. Defaults to 100000.
+        genotype (bool, optional): Also compute the quality-aware genotype fields. Defaults to False.
+
+    Yields:
+        pandas.DataFrame: call_pileup_chunk output for each chunk
+    """
+    for chunk in read_pileup_chunks(pileup_file, chunksize=chunksize):
+        yield call_pileup_chunk(chunk, min_depth, hom_threshold=hom_threshold, low_threshold=low_threshold,
+                                genotype=genotype, min_base_quality=min_base_quality)
+
+def call_pileup_chunk(chunk, min_depth, hom_threshold=HOM_THRESHOLD, low_threshold=LOW_THRESHOLD,
+                      genotype=False, min_base_quality=MIN_BASE_QUALITY):
+    """Calls every position of a chunk read by pileup_utils.read_pileup_chunks.
+
+    Returns:
+        pandas.DataFrame: CHROM, POS, REF, DP and CALL columns, plus ALT, GT, GQ, QUAL and PL
+        (genotype likelihood mode) when genotype is set
+    """
+    pileup = [strip_pileup_markers(item) for item in chunk['pileup_string'].tolist()]
+    calls = call_variants_batch(pileup, chunk['REF'], min_depth,
+                                hom_threshold=hom_threshold, low_threshold=low_threshold)
+    calls_df = pd.DataFrame({'CHROM': chunk['CHROM'].values, 'POS': chunk['POS'].values,
+                             'REF': chunk['REF'].values, 'DP': np.fromiter(map(len, pileup), dtype=np.int64, count=len(pileup)),
+                             'CALL': calls})
+    if genotype:
+        ref = chunk['REF'].str.upper().tolist()
+        alt, gl = genotype_likelihoods(pileup, chunk['qual_string'].tolist(), ref, min_base_quality=min_base_quality)
+        gt, pl, gq, qual = genotype_from_likelihoods(gl)
+        calls_df['ALT'] = np.array(list(ALLELES))[alt]
+        calls_df['GT'] = [GENOTYPES[idx] for idx in gt]
+        calls_df['GQ'] = gq
+        calls_df['QUAL'] = qual
+        calls_df['PL'] = list(map(tuple, pl.tolist()))
+    return calls_df
+
+## Genome-wide mode
+def split_genome(fasta, region_size=REGION_SIZE):
+    """Splits every contig of the reference into regions of at most region_size bases.
+
+    Args:
+        fasta (str): Path to the reference FASTA
+        region_size (int, optional): Region length. Defaults to REGION_SIZE.
+
+    Returns:
+        list: (chrom, start, end) tuples, 0-based half open, in reference order
+    """
+    regions = []
+    for chrom, length in VCFwriter.get_contigs(fasta):
+        for start in range(0, length, region_size):
+            regions.append((chrom, start, min(start+region_size, length)))
+    return regions
+
+def calls_to_vcf_records(calls_df, min_qual=MIN_QUAL):
+    """Converts the variant rows of a calls dataframe into VCFwriter records. Hom calls are
+    genotyped 1/1, het calls 0/1 (1/2 for two het alleles) and sites with only low calls are
+    0/1 with a LowFraction filter. Calls made in genotype likelihood mode keep their genotype,
+    QUAL, GQ and PL instead and are filtered as LowQual when QUAL is below min_qual.
+
+    Args:
+        calls_df (pandas.DataFrame): Output of call_pileup_chunk / call_pileup_file
+        min_qual (float, optional): QUAL threshold of the likelihood mode. Defaults to 20.
+
+    Returns:
+        pandas.DataFrame: #CHROM, POS, REF, ALT, GT and FILTER columns (and QUAL, GQ, PL)
+    """
+    if 'QUAL' in calls_df.columns:
+        variants = calls_df[(calls_df['CALL'] != 'nocall') & (calls_df['GT'] != GENOTYPES[0])]
+        records = variants[['CHROM', 'POS', 'REF', 'ALT', 'GT', 'QUAL', 'GQ', 'PL']].rename(columns={'CHROM': '#CHROM'})
+        records['REF'] = records['REF'].str.upper()
+        records['FILTER'] = np.where(records['QUAL'] >= min_qual, 'PASS', 'LowQual')
+        return records
+    variants = calls_df[~calls_df['CALL'].isin(['nocall', 'ref'])]
+    records = []
+    for chrom, pos, ref, call in zip(variants['CHROM'], variants['POS'], variants['REF'], variants['CALL']):
+        alleles = [item.split(' ') for item in call.split(',')]
+        alts = [allele for allele, suffix in alleles]
+        suffixes = [suffix for allele, suffix in alleles]
+        if 'hom' in suffixes:
+            gt = (suffixes.index('hom')+1,)*2
+        elif suffixes.count('het') > 1:
+            het = [idx+1 for idx, suffix in enumerate(suffixes) if suffix == 'het']
+            gt = (het[0], het[1])
+        elif 'het' in suffixes:
+            gt = (0, suffixes.index('het')+1)
+        else:
+            gt = (0, 1)
+        vcf_filter = 'PASS' if set(suffixes) & {'hom', 'het'} else 'LowFraction'
+        records.append((chrom, pos, ref.upper(), ','.join(alts), gt, vcf_filter))
+    return pd.DataFrame(records, columns=VCF_COLUMNS)
+
+def _region_pileup(region, fasta, bam=None, pileup=None):
+    """mpileup text for one region, from the BAM through samtools or from a tabix indexed pileup"""
+    chrom, start, end = region
+    if bam:
+        return pysam.mpileup('-f', fasta, '-r', "{c}:{s}-{e}".format(c=chrom, s=start+1, e=end), bam)
+    with pysam.TabixFile(pileup) as tabix:
+        # mpileup leaves out contigs without coverage, tabix cannot fetch from those
+        if chrom not in tabix.contigs:
+            return ''
+        return ''.join(line+'\n' for line in tabix.fetch(chrom, start, end))
+
+def _call_region(task):
+    """Worker: calls one region and returns its variants with the throughput numbers"""
+    region, fasta, bam, pileup, caller_args, min_qual = task
+    start_time = time.time()
+    text = _region_pileup(region, fasta, bam=bam, pileup=pileup)
+    n_positions = 0
+    variants = []
+    if text.strip():
+        for calls in call_pileup_file(StringIO(text), **caller_args):
+            n_positions += calls.shape[0]
+            variants.append(calls_to_vcf_records(calls, min_qual=min_qual))
+    variants = pd.concat(variants) if variants else pd.DataFrame(columns=VCF_COLUMNS)
+    return region, variants, n_positions, time.time()-start_time
+
+def _call_chunk(task):
+    """Worker: calls the rows of one chromosome from a chunk of a plain (not indexed) pileup"""
+    chunk, caller_args, min_qual = task
+    start_time = time.time()
+    variants = calls_to_vcf_records(call_pileup_chunk(chunk, **caller_args), min_qual=min_qual)
+    chrom = chunk['CHROM'].iloc[0]
+    region = (chrom, int(chunk['POS'].iloc[0])-1, int(chunk['POS'].iloc[-1]))
+    return region, variants, chunk.shape[0], time.time()-start_time
+
+def call_genome(fasta, bam=None, pileup=None, min_depth=MIN_DEPTH, workers=1, region_size=REGION_SIZE,
+                hom_threshold=HOM_THRESHOLD, low_threshold=LOW_THRESHOLD, chunksize=100000,
+                genotype=False, min_base_quality=MIN_BASE_QUALITY, min_qual=MIN_QUAL):
+    """Calls variants genome-wide on a pool of worker processes. With a BAM, or a bgzipped
+    and tabix indexed pileup, the reference is split into regions of region_size bases and each
+    worker runs one region; a plain pileup is streamed and its chunks are shipped to the workers,
+    with at most two chunks per worker read ahead of the results. Results come back in coordinate order.
+
+    Args:
+        fasta (str): Reference FASTA (indexed for BAM input)
+        bam (str, optional): Indexed BAM to pileup. Defaults to None.
+        pileup (str, optional): samtools mpileup output. Defaults to None.
+        min_depth (int, optional): Positions with a lower depth are "nocall". Defaults to MIN_DEPTH.
+        workers (int, optional): Number of worker processes. Defaults to 1.
+        region_size (int, optional): Bases per region. Defaults to REGION_SIZE.
+        genotype (bool, optional): Genotype from base-quality likelihoods and filter on QUAL
+            instead of the percentage rules. Defaults to False.
+
+    Returns:
+        tuple: (variants, throughput) dataframes. variants is ready for VCFwriter.write_dataframe,
+        throughput has one row per region with its position count, runtime and positions per second.
+        variants is empty (VCF_COLUMNS only) when no region produced a call.
+    """
+    if not bam and not pileup:
+        raise ValueError("Either a BAM or a pileup is required")
+    caller_args = dict(min_depth=min_depth, hom_threshold=hom_threshold, low_threshold=low_threshold,
+                       genotype=genotype, min_base_quality=min_base_quality)
+    if bam or os.path.exists(pileup+".tbi"):
+        worker = _call_region
+        tasks = ((region, fasta, bam, pileup, dict(caller_args, chunksize=chunksize), min_qual)
+                 for region in split_genome(fasta, region_size))
+    else:
+        worker = _call_chunk
+        tasks = ((chrom_chunk, caller_args, min_qual) for chunk in read_pileup_chunks(pileup, chunksize=chunksize)
+                 for chrom, chrom_chunk in chunk.groupby('CHROM', sort=False))
+    variants = []
+    throughput = []
+    with multiprocessing.Pool(workers) as pool:
+        for region, region_variants, n_positions, elapsed in imap_bounded(pool, worker, tasks, workers*2):
+            chrom, start, end = region
+            rate = n_positions/elapsed if elapsed > 0 else float('nan')
+            logger.info("{c}:{s}-{e}: {n} positions, {v} variants in {t:.2f}s ({r:.0f} positions/s)".format(
+                c=chrom, s=start+1, e=end, n=n_positions, v=region_variants.shape[0], t=elapsed, r=rate))
+            variants.append(region_variants)
+            throughput.append((chrom, start, end, n_positions, region_variants.shape[0], elapsed, rate))
+    throughput = pd.DataFrame(throughput, columns=['CHROM', 'START', 'END', 'POSITIONS', 'VARIANTS', 'SECONDS', 'POSITIONS_PER_SECOND'])
+    if not variants:
+        return pd.DataFrame(columns=VCF_COLUMNS), throughput
+    return pd.concat(variants, ignore_index=True), throughput
+
 def main():
-    call_set = call_variants(test_pileup, test_ref, 5)
+    parser = argparse.ArgumentParser(description="Naive SNV caller. Runs on the bundled example when no BAM or pileup is given.")
+    parser.add_argument("-f", "--fasta", help="Reference FASTA")
+    parser.add_argument("-b", "--bam", help="Indexed BAM to call from")
+    parser.add_argument("-p", "--pileup", help="samtools mpileup output to call from (bgzip + tabix it for region splitting)")
+    parser.add_argument("-o", "--output", default="-", help="Output VCF. Defaults to stdout")
+    parser.add_argument("-s", "--sample", default="SAMPLE", help="Sample name in the VCF")
+    parser.add_argument("-d", "--min_depth", type=int, default=MIN_DEPTH, help="Minimum depth to make a call")
+    parser.add_argument("--hom_threshold", type=float, default=HOM_THRESHOLD, help="Alt percentage above which a call is hom")
+    parser.add_argument("--low_threshold", type=float, default=LOW_THRESHOLD, help="Alt percentage below which a call is low")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(), help="Worker processes")
+    parser.add_argument("-r", "--region_size", type=int, default=REGION_SIZE, help="Bases per region")
+    parser.add_argument("-g", "--genotype_likelihoods", action="store_true",
+                        help="Genotype from base-quality likelihoods (GT/GQ/PL, QUAL) instead of the percentage rules")
+    parser.add_argument("--min_base_quality", type=int, default=MIN_BASE_QUALITY, help="Ignore bases below this quality in likelihood mode")
+    parser.add_argument("--min_qual", type=float, default=MIN_QUAL, help="QUAL below which likelihood mode calls are filtered as LowQual")
+    parser.add_argument("-t", "--throughput_report", help="Write the per-region throughput table to this TSV")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
 
-    result = [print(str(idx+1)+"\t"+str(item)) for idx, item in enumerate(call_set)]
+    if not args.bam and not args.pileup:
+        call_set = call_variants(test_pileup, test_ref, args.min_depth)
+        result = [print(str(idx+1)+"\t"+str(item)) for idx, item in enumerate(call_set)]
+        return
+    if not args.fasta:
+        parser.error("--fasta is required with --bam/--pileup")
+    setup_logger(debug=args.verbose)
+    variants, throughput = call_genome(args.fasta, bam=args.bam, pileup=args.pileup, min_depth=args.min_depth,
+                                       workers=args.workers, region_size=args.region_size,
+                                       hom_threshold=args.hom_threshold, low_threshold=args.low_threshold,
+                                       genotype=args.genotype_likelihoods, min_base_quality=args.min_base_quality,
+                                       min_qual=args.min_qual)
+    VCFwriter().write_dataframe(variants, args.fasta, args.sample, args.output)
+    if args.throughput_report:
+        throughput.to_csv(args.throughput_report, sep="\t", index=False)
 
 
 if __name__ == "__main__":
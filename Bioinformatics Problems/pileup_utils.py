@@ -1,13 +1,18 @@
 from io import StringIO
 from collections import Counter
+import csv
 import pandas as pd
 import re
 
+PILEUP_COLUMNS = ['CHROM','POS','REF','NREADS','pileup_string','qual_string']
+_READ_MARKER_PATTERN = re.compile(r'\^.|\$')
+_INDEL_PATTERN = re.compile(r'[+-](\d+)')
+
 def parse_pileup_row(row):
     if row:
         pileup_row = StringIO(row)
         pileup_df = pd.read_csv(pileup_row, header=None,sep="\t")
-        pileup_df.columns = ['CHROM','POS','REF','NREADS','pileup_string','qual_string']
+        pileup_df.columns = PILEUP_COLUMNS
         return pileup_df, Counter(pileup_df['pileup_string'].tolist()[0])
     else:
         return pd.DataFrame(), Counter(row)
@@ -27,3 +32,49 @@ def get_indel_from_pileup_string(s):
     indel_patterns = re.findall(pattern, s)
     unique_indel_patterns = [item.upper() for item in indel_patterns]
     return (Counter(indel_patterns), Counter(unique_indel_patterns))
+
+def strip_pileup_markers(s):
+    """Removes read start (^ plus mapping quality), read end ($) and indel
+    (+2AG / -1c) annotations from a pileup string, leaving one character per read base.
+
+    Args:
+        s (str): Raw pileup string as written by samtools mpileup
+
+    Returns:
+        str: Pileup string with one character per read overlapping the position
+    """
+    s = _READ_MARKER_PATTERN.sub('', s)
+    if '+' not in s and '-' not in s:
+        return s
+    pieces = []
+    last = 0
+    for match in _INDEL_PATTERN.finditer(s):
+        if match.start() < last:
+            continue
+        pieces.append(s[last:match.start()])
+        last = match.end() + int(match.group(1))
+    pieces.append(s[last:])
+    return ''.join(pieces)
+
+def read_pileup_chunks(pileup_file, chunksize=100000):
+    """Streams an mpileup file in chunks of rows. Only the first sample's columns are kept,
+    so multi-sample pileups are read as if they only contained the first sample.
+
+    Args:
+        pileup_file (str or file): Path or handle of the mpileup output
+        chunksize (int, optional): Number of pileup rows per chunk. Defaults to 100000.
+
+    Yields:
+        pandas.DataFrame: Chunk with the PILEUP_COLUMNS columns
+    """
+    reader = pd.read_csv(pileup_file, sep="\t", header=None, usecols=range(len(PILEUP_COLUMNS)),
+                         names=PILEUP_COLUMNS, quoting=csv.QUOTE_NONE, chunksize=chunksize,
+                         dtype={'CHROM': str, 'POS': int, 'REF': str, 'NREADS': int,
+                                'pileup_string': str, 'qual_string': str},
+                         keep_default_na=False)
+    for chunk in reader:
+        ## samtools writes "*" for the bases and qualities of positions without coverage
+        empty = chunk['NREADS'] == 0
+        chunk.loc[empty, 'pileup_string'] = ''
+        chunk.loc[empty, 'qual_string'] = ''
+        yield chunk
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 from scipy.stats import beta
 
 def generate_analytical_sensitivity_stats(success, total, confint=0.95):
@@ -46,3 +47,59 @@ def binom_interval(success, total, confint=0.95):
     if success == 0:
         lower = 0.00000
     return (round(lower,2)*100, round(upper,2)*100)
+
+# Clopper-Pearson bounds already computed, keyed by (success, total, confint)
+_interval_cache = {}
+
+def binom_intervals(successes, totals, confint=0.95):
+    """[Vectorized binom_interval: Clopper-Pearson bounds for arrays of successes and totals in one call.
+    Every distinct (success, total) pair is computed once and kept in a cache shared by later calls.]
+
+    Arguments:
+        successes {[array-like]} -- [Number of successes per stratum]
+        totals {[array-like]} -- [Number of observations per stratum]
+
+    Keyword Arguments:
+        confint {float} -- [The % for which confidence interval is to be computed] (default: {0.95})
+
+    Returns:
+        [tuple] -- [Arrays of lower and upper CI in %, rounded like binom_interval. NaN where total is 0]
+    """
+    successes = np.asarray(successes, dtype=np.int64)
+    totals = np.asarray(totals, dtype=np.int64)
+    pairs, inverse = np.unique(np.stack([successes.ravel(), totals.ravel()], axis=1), axis=0, return_inverse=True)
+    bounds = np.array([_interval_cache.get((k, n, confint), (np.nan, np.nan)) for k, n in pairs.tolist()], dtype=float).reshape(-1, 2)
+    missing = np.isnan(bounds[:, 0]) & (pairs[:, 1] > 0)
+    if missing.any():
+        k, n = pairs[missing, 0], pairs[missing, 1]
+        quantile = (1 - confint) / 2.
+        # k == 0 and k == n are pinned to 0 and 1, the shape parameters are only kept valid there
+        lower = np.where(k == 0, 0.0, beta.ppf(quantile, np.maximum(k, 1), n - k + 1))
+        upper = np.where(k == n, 1.0, beta.ppf(1 - quantile, k + 1, np.maximum(n - k, 1)))
+        bounds[missing] = np.column_stack([np.round(lower, 2)*100, np.round(upper, 2)*100])
+        _interval_cache.update(zip(zip(k.tolist(), n.tolist(), [confint]*len(k)), map(tuple, bounds[missing].tolist())))
+    bounds = bounds[inverse.ravel()]
+    return bounds[:, 0].reshape(successes.shape), bounds[:, 1].reshape(successes.shape)
+
+def sensitivity_stats_table(successes, totals, confint=0.95, index=None):
+    """[Vectorized generate_analytical_sensitivity_stats over many strata at once]
+
+    Arguments:
+        successes {[array-like]} -- [Number of successes (TP) per stratum]
+        totals {[array-like]} -- [N per stratum]
+
+    Keyword Arguments:
+        confint {float} -- [The % for which confidence interval is to be computed] (default: {0.95})
+        index {[array-like]} -- [Stratum labels used as the dataframe index] (default: {None})
+
+    Returns:
+        [pd.DataFrame] -- [One row per stratum with the N, TP, FN, Sensitivity, Min_CI and Max_CI columns
+        of generate_analytical_sensitivity_stats; Sensitivity and CIs are NaN where N is 0]
+    """
+    successes = np.asarray(successes, dtype=np.int64)
+    totals = np.asarray(totals, dtype=np.int64)
+    lower_ci, upper_ci = binom_intervals(successes, totals, confint)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sensitivity = np.where(totals > 0, np.round(successes / totals, 2)*100, np.nan)
+    return pd.DataFrame({"N": totals, "TP": successes, "FN": totals - successes, "Sensitivity": sensitivity,
+                         "Min_CI": lower_ci, "Max_CI": upper_ci}, index=index)
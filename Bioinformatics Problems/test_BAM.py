@@ -0,0 +1,85 @@
+import random
+import numpy as np
+import pysam
+from BAM import *
+
+def write_bam(path, n_pairs=60, seed=7):
+	"""Coordinate sorted and indexed BAM of random pairs over two contigs, with duplicates, QC failures,
+	secondary and supplementary alignments, indels, soft clips, MAPQ 0 reads and unplaced unmapped pairs"""
+	rng = random.Random(seed)
+	header = {"HD": {"VN": "1.6", "SO": "coordinate"},
+			  "SQ": [{"SN": "chr1", "LN": 2000}, {"SN": "chr2", "LN": 1500}]}
+	reads = []
+	with pysam.AlignmentFile(str(path) + ".unsorted.bam", "wb", header=header) as bam:
+		for pair in range(n_pairs):
+			contig = rng.randrange(2)
+			start = rng.randrange(0, 1200)
+			insert = rng.randrange(150, 300)
+			length = rng.choice([50, 75, 100])
+			unplaced = pair % 17 == 0
+			for mate in range(2):
+				read = pysam.AlignedSegment(bam.header)
+				read.query_name = "pair{p}".format(p=pair)
+				read.query_sequence = "".join(rng.choice("ACGT") for _ in range(length))
+				read.query_qualities = [30]*length
+				flag = PAIRED | (0x40 if mate == 0 else 0x80)
+				if unplaced:
+					flag |= UNMAPPED | MATE_UNMAPPED
+					read.reference_id = read.next_reference_id = -1
+					read.reference_start = read.next_reference_start = -1
+				else:
+					flag |= PROPER_PAIR if pair % 5 else 0
+					flag |= (MATE_REVERSE if mate == 0 else REVERSE)
+					flag |= DUPLICATE if pair % 7 == 0 else 0
+					flag |= QCFAIL if pair % 11 == 0 and mate else 0
+					read.reference_id = read.next_reference_id = contig
+					read.reference_start = start + (insert - length)*mate
+					read.next_reference_start = start + (insert - length)*(1 - mate)
+					read.cigarstring = rng.choice(["{l}M".format(l=length), "5S{l}M".format(l=length-5),
+												   "20M2I{l}M".format(l=length-22), "30M4D{l}M".format(l=length-30)])
+					read.template_length = insert if mate == 0 else -insert
+					read.mapping_quality = 0 if pair % 9 == 0 else 60
+				read.flag = flag
+				reads.append(read)
+		for extra_flag in [SECONDARY, SUPPLEMENTARY]:
+			read = pysam.AlignedSegment(bam.header)
+			read.query_name, read.flag = "extra{f}".format(f=extra_flag), extra_flag
+			read.query_sequence, read.query_qualities = "ACGT"*10, [30]*40
+			read.reference_id, read.reference_start, read.cigarstring, read.mapping_quality = 0, 100, "40M", 5
+			reads.append(read)
+		for read in reads:
+			bam.write(read)
+	pysam.sort("-o", str(path), str(path) + ".unsorted.bam")
+	pysam.index(str(path))
+	return str(path)
+
+COMPARED_FIELDS = ["raw_total_sequences", "reads_mapped", "reads_mapped_and_paired", "reads_unmapped",
+				   "reads_properly_paired", "reads_paired", "reads_duplicated", "reads_mq0", "reads_qc_failed",
+				   "non_primary_alignments", "supplementary_alignments", "total_length", "bases_mapped",
+				   "maximum_length", "average_length"]
+
+def test_generate_stats_matches_samtools(tmp_path, monkeypatch, reset_logging):
+	monkeypatch.chdir(tmp_path)
+	bam = write_bam(tmp_path / "reads.bam")
+	expected, expected_histograms = SamtoolsStats.parse_stats_lines(pysam.stats(bam).splitlines())
+	for workers, region_size in [(1, REGION_SIZE), (2, 300)]:
+		summary, histograms = BAM(bam).generate_stats(workers=workers, region_size=region_size,
+													  output=str(tmp_path / "reads.stats")).parse()
+		assert {key: summary[key] for key in COMPARED_FIELDS} == {key: expected[key] for key in COMPARED_FIELDS}
+		for section in ["COV", "RL"]:
+			assert histograms[section].tolist() == expected_histograms[section].tolist()
+		written, written_histograms = SamtoolsStats.parse_samtools_stats_sections(str(tmp_path / "reads.stats"))
+		assert written == summary
+		with open(str(tmp_path / "reads.stats")) as stats_file:
+			labels = {line.split("\t")[1] for line in stats_file if line.startswith("SN")}
+		assert {"reads MQ0:", "non-primary alignments:", "reads QC failed:"} <= labels
+
+def test_generate_stats_without_reads(tmp_path, monkeypatch, reset_logging):
+	monkeypatch.chdir(tmp_path)
+	bam = str(tmp_path / "empty.bam")
+	with pysam.AlignmentFile(bam, "wb", header={"HD": {"VN": "1.6", "SO": "coordinate"}}):
+		pass
+	pysam.index(bam)
+	summary, histograms = BAM(bam).generate_stats().parse()
+	assert summary["raw_total_sequences"] == 0 and summary["insert_size_average"] == 0.0
+	assert histograms["COV"].shape == (0, 2)
@@ -0,0 +1,55 @@
+from SamtoolsStats import *
+
+STATS = """# This file was produced by samtools stats
+CHK	248b5f1c	4f1b0a36	ad1b1fd5
+SN	raw total sequences:	200
+SN	reads mapped and paired:	180	# paired-end technology bit set + both mates mapped
+SN	reads unmapped:	12
+SN	reads MQ0:	3	# mapped and MQ=0
+SN	error rate:	1.234567e-03	# mismatches / bases mapped (cigar)
+SN	average length:	100
+SN	insert size average:	250.8
+RL	99	20
+RL	100	180
+COV	[1-1]	1	35
+COV	[2-2]	2	410
+GCD	0.0	12.500	0.05	0.05	0.05	0.05	0.05
+"""
+
+def write_stats(path, text=STATS):
+	path.write_text(text)
+	return str(path)
+
+def test_parse_stats_types_and_histograms(tmp_path):
+	summary, histograms = SamtoolsStats.parse_samtools_stats_sections(write_stats(tmp_path / "a.stats"))
+	assert summary["raw_total_sequences"] == 200 and isinstance(summary["raw_total_sequences"], int)
+	assert summary["reads_mapped_and_paired"] == 180
+	assert summary["reads_unmapped"] == summary["unmapped_reads"] == 12
+	assert summary["reads_mq0"] == 3
+	assert summary["error_rate"] == 1.234567e-03 and summary["insert_size_average"] == 250.8
+	assert histograms["RL"].tolist() == [[99, 20], [100, 180]]
+	assert histograms["COV"].tolist() == [[1, 35], [2, 410]]
+	assert histograms["GCD"].dtype == float and histograms["IS"].shape == (0, 0)
+	assert SamtoolsStats.parse_samtools_stats_sections(str(tmp_path / "a.stats"), sections=["RL"])[1].keys() == {"RL"}
+
+def test_incremental_aggregation(tmp_path, monkeypatch):
+	numeric, first, second = write_stats(tmp_path / "1001.stats"), write_stats(tmp_path / "1002.stats"), write_stats(tmp_path / "1003.stats")
+	output = str(tmp_path / "qc.tsv")
+	table = aggregate_stats(collect_stats_files(pattern=str(tmp_path / "*.stats")), output=output)
+	assert table["sample"].tolist() == ["1001", "1002", "1003"] and table["raw_total_sequences"].tolist() == [200, 200, 200]
+	written = read_table(output)
+	pd.testing.assert_frame_equal(written, table)
+	write_table(written, str(tmp_path / "copy.tsv"))
+	pd.testing.assert_frame_equal(read_table(str(tmp_path / "copy.tsv")), table)
+
+	parsed = []
+	parse = SamtoolsStats.parse_samtools_stats
+	monkeypatch.setattr(SamtoolsStats, "parse_samtools_stats", staticmethod(lambda path: parsed.append(path) or parse(path)))
+	write_stats(tmp_path / "1003.stats", STATS.replace("raw total sequences:\t200", "raw total sequences:\t300"))
+	os.utime(second, (os.path.getmtime(first) + 10,)*2)
+	third = write_stats(tmp_path / "1004.stats")
+	stats_files = collect_stats_files(pattern=str(tmp_path / "*.stats")) + [("gone", str(tmp_path / "gone.stats"))]
+	table = aggregate_stats(stats_files, output=output)
+	assert parsed == [second, third]
+	assert table["sample"].tolist() == ["1001", "1002", "1003", "1004"] and table["raw_total_sequences"].tolist() == [200, 200, 300, 200]
+	pd.testing.assert_frame_equal(read_table(output), table)
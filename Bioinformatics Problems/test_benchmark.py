@@ -0,0 +1,21 @@
+from benchmark import benchmark
+
+HEADER = "##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+
+def write_vcf(path, records):
+	path.write_text(HEADER + "".join("\t".join([chrom, str(pos), ".", ref, alt, ".", "PASS", info]) + "\n" for chrom, pos, ref, alt, info in records))
+	return str(path)
+
+def test_benchmark_strata(tmp_path):
+	truth = write_vcf(tmp_path / "truth.vcf", [("1", 100, "A", "G", "AF=0.5"), ("1", 200, "C", "T,CA", "AF=0.03,0.4"),
+	                                          ("1", 300, "G", "A", "AF=0.5"), ("2", 50, "TT", "T", "AF=0.5")])
+	query = write_vcf(tmp_path / "query.vcf", [("1", 100, "A", "G", "."), ("1", 200, "C", "CA", "."), ("2", 50, "TT", "T", "."),
+	                                          ("2", 80, "G", "C", "AF=0.1")])
+	bed = tmp_path / "region.bed"
+	bed.write_text("1\t90\t150\n1\t140\t210\n")
+	table = benchmark(truth, query, regions={"region": str(bed)}).set_index(["Region", "VAR_TYPE", "AF_bin"])
+	assert table.loc[("ALL", "ALL", "ALL"), ["TP", "FN", "FP"]].tolist() == [3, 2, 1]
+	assert table.loc[("ALL", "INDEL", "ALL"), ["TP", "FN", "FP"]].tolist() == [2, 0, 0]
+	assert table.loc[("region", "SNV", "ALL"), ["TP", "FN", "FP"]].tolist() == [1, 1, 0]
+	assert table.loc[("ALL", "SNV", "(0.05, 0.1]"), "FP"] == 1
+	assert table.loc[("ALL", "ALL", "ALL"), "Precision"] == 75.0
@@ -0,0 +1,30 @@
+from cigar import *
+
+def test_all_ops_are_parsed():
+	c = CIGAR("2S4M3I6D100N2=1X1H", start=10)
+	assert c.cparsed == ['2S', '4M', '3I', '6D', '100N', '2=', '1X', '1H']
+	assert c.query_length == 12
+	assert c.reference_length == 113
+
+def test_expand_cigar():
+	assert CIGAR("2M1I1D").cigar_scorer == [[1, 1], [1, 1], [1, 0], [0, 1]]
+
+def test_coordinate_translation_across_indels():
+	c = CIGAR("8M7D6M2I2M11D7M", start=3)
+	assert [c.query_to_ref(q) for q in [0, 7, 8, 13, 14, 16, 18, 25]] == [3, 10, 18, 23, 24, 24, 37, -1]
+	assert [c.ref_to_query(r) for r in [2, 10, 11, 18, 26, 37, 44]] == [-1, 7, 8, 8, 18, 18, -1]
+	assert c.query_to_ref_array([4, 13, -1]).tolist() == [7, 23, -1]
+	assert c.ref_to_query_array([7, 23]).tolist() == [4, 13]
+
+def test_aligned_blocks():
+	ref_starts, ref_ends, query_starts = CIGAR("2S3M1I2M4N1=", start=10).aligned_blocks()
+	assert ref_starts.tolist() == [10, 13, 19]
+	assert ref_ends.tolist() == [13, 15, 20]
+	assert query_starts.tolist() == [2, 6, 8]
+
+def test_unavailable_cigar_is_empty():
+	c = CIGAR("*", start=10)
+	assert c.cparsed == [] and c.cigar_scorer == []
+	assert c.query_length == 0 and c.reference_length == 0
+	assert c.query_to_ref(0) == -1 and c.ref_to_query(10) == -1
+	assert [block.tolist() for block in c.aligned_blocks()] == [[], [], []]
@@ -0,0 +1,38 @@
+import pandas as pd
+from genomic_to_transcript_coords import *
+
+TRANSCRIPTS = pd.DataFrame([("TR1", "CHR1", 3, "8M7D6M2I2M11D7M"), ("TR2", "CHR1", 12, "2S5M3N4M1I2=1X"),
+							("TR3", "CHR2", 0, "10M")], columns=["Transcript", "Chromosome", "Pos", "Cigar"])
+
+def brute_force_mapping(transcript_index):
+	"""(chromosome, genomic position) -> [(transcript, transcript position)] by walking every CIGAR base by base"""
+	mapping = {}
+	for transcript_id, (chromosome, cigar_obj) in transcript_index.transcripts.items():
+		query_pos, ref_pos = 0, cigar_obj.start
+		for consumes_query, consumes_ref in cigar_obj.cigar_scorer:
+			if consumes_query and consumes_ref:
+				mapping.setdefault((chromosome, ref_pos), []).append((transcript_id, query_pos))
+			query_pos += consumes_query
+			ref_pos += consumes_ref
+	return mapping
+
+def test_lookup_matches_brute_force():
+	transcript_index = TranscriptIndex(TRANSCRIPTS)
+	expected = brute_force_mapping(transcript_index)
+	for max_block_length in [2, 3, MAX_BLOCK_LENGTH]:
+		genomic_index = GenomicIndex(transcript_index, max_block_length=max_block_length)
+		for chromosome in ["CHR1", "CHR2", "CHR3"]:
+			positions = list(range(-2, 50))
+			query_indices, transcript_ids, transcript_positions = genomic_index.lookup(chromosome, positions)
+			found = {}
+			for query_index, transcript_id, transcript_pos in zip(query_indices, transcript_ids, transcript_positions):
+				found.setdefault((chromosome, positions[query_index]), []).append((transcript_id, int(transcript_pos)))
+			assert {key: sorted(value) for key, value in found.items()} == \
+				{key: sorted(value) for key, value in expected.items() if key[0] == chromosome}
+
+def test_map_vcf():
+	genomic_index = GenomicIndex(TranscriptIndex(TRANSCRIPTS))
+	vcf_df = pd.DataFrame({"CHROM": ["CHR1", "CHR3", "CHR1", "CHR2", "CHR1"], "POS": [14, 5, 4, 11, 22]})
+	mapped = genomic_index.map_vcf(vcf_df)
+	assert list(mapped[["query_index"] + OUTPUT_COLUMNS].itertuples(index=False, name=None)) == \
+		[(0, "CHR1", 14, "TR2", 3), (2, "CHR1", 4, "TR1", 0), (4, "CHR1", 22, "TR1", 11), (4, "CHR1", 22, "TR2", 8)]
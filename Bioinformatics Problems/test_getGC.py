@@ -6,4 +6,33 @@ def test_empty_string():
 
 def test_nonGC_string():
 	s = "abtbabfabfabagbab"
-	assert getGC([s]) == (0.0, "abtbabfabfabagbab", 0)
\ No newline at end of file
+	assert getGC([s]) == (0.0, "abtbabfabfabagbab", 0)
+
+def test_max_gc_index():
+	assert getGC(["", "AT", "GCGA", "CCGG", "ATGC"]) == (1.0, "CCGG", 3)
+
+def test_gc_track(tmp_path):
+	fasta = tmp_path / "ref.fa"
+	fasta.write_text(">chr1 test\nGGGGAAAA\nCCNNTTTT\nGC\n>chr2\nAT\n")
+	track = gc_track(str(fasta), window=4, step=2)
+	chr1 = track[track["chrom"] == "chr1"]
+	assert chr1["start"].tolist() == [0, 2, 4, 6, 8, 10, 12, 14]
+	assert chr1["gc"].tolist()[:5] == [1.0, 0.5, 0.0, 0.5, 1.0]
+	assert chr1["acgt"].tolist()[4] == 2
+	assert track[track["chrom"] == "chr2"][["start", "end", "gc"]].values.tolist() == [[0, 2, 0.0]]
+
+def test_gc_track_keeps_contig_end(tmp_path):
+	fasta = tmp_path / "ref.fa"
+	fasta.write_text(">chr1\nAAAAAAAAAA\nAAAAAAAAAA\nGGGGG\n")
+	track = gc_track(str(fasta), window=10)
+	assert track[["start", "end", "gc"]].values.tolist() == [[0, 10, 0.0], [10, 20, 0.0], [20, 25, 1.0]]
+	track = gc_track(str(fasta), window=10, step=4)
+	assert track["start"].tolist() == [0, 4, 8, 12, 16] and track["end"].tolist()[-2:] == [22, 25]
+	unterminated = tmp_path / "unterminated.fa"
+	unterminated.write_text(">c\nACGT\nGGCC")
+	track = gc_track(str(unterminated), window=3)
+	assert track[["start", "end", "gc"]].values.tolist() == [[0, 3, 2/3], [3, 6, 2/3], [6, 8, 1.0]]
+	unterminated.write_text(">c\nACGT\nGGCA\n>d\nAT\nGC")
+	unterminated.with_name("unterminated.fa.fai").unlink()
+	track = gc_track(str(unterminated), window=4)
+	assert track[["chrom", "gc"]].values.tolist() == [["c", 0.5], ["c", 0.75], ["d", 0.5]]
@@ -0,0 +1,22 @@
+import os
+import networkx as nx
+import numpy as np
+import mst
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mst-tsp", "data")
+
+def test_mst_costs_match_networkx():
+	G = nx.read_gexf(os.path.join(DATA, "r15.gexf"))
+	expected = nx.minimum_spanning_tree(G).size(weight="weight")
+	assert np.isclose(mst.heuristic(G), expected)
+	D = nx.to_numpy_array(G, nonedge=np.inf)
+	edges = mst.prim_mst(D)
+	assert len(edges) == 14 and np.isclose(sum(D[u, v] for u, v in edges), expected)
+
+def test_union_find():
+	UF = mst.make_union_find(6)
+	mst.union(UF, mst.find(UF, 0), mst.find(UF, 1))
+	mst.union(UF, mst.find(UF, 2), mst.find(UF, 3))
+	mst.union(UF, mst.find(UF, 1), mst.find(UF, 3))
+	assert len({mst.find(UF, s) for s in range(4)}) == 1
+	assert mst.find(UF, 4) != mst.find(UF, 0) and mst.find(UF, 5) == 5
@@ -0,0 +1,62 @@
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pandas as pd
+from mutation import SequenceCache, fetch_sequences, apply_mutations, apply_mutations_batch
+
+CDS = {"NM_000001.1": "ATGGCTTAA", "NM_000002.3": "ATGAAACCCTGA"}
+
+class StubEutils(BaseHTTPRequestHandler):
+	"""Answers efetch POSTs with fasta_cds_na records of the CDS table, unversioned ids get the
+	record of their (only) version as NCBI returns the latest one"""
+	requests = []
+
+	def do_POST(self):
+		params = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+		ids = params["id"][0].split(",")
+		StubEutils.requests.append(ids)
+		found = [a for i in ids for a in CDS if a == i or a.split(".")[0] == i]
+		body = "".join(">lcl|{a}_cds_NP_1.1_1 [gene=X]\n{s}\n".format(a=a, s=CDS[a]) for a in found)
+		self.send_response(200)
+		self.end_headers()
+		self.wfile.write(body.encode())
+
+	def log_message(self, *args):
+		pass
+
+def test_fetch_sequences_cache_and_offline(tmp_path):
+	server = HTTPServer(("127.0.0.1", 0), StubEutils)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	url = "http://127.0.0.1:{p}/".format(p=server.server_port)
+	cache = SequenceCache(str(tmp_path / "cache.sqlite"))
+	try:
+		found = fetch_sequences(["NM_000001.1", "NM_000002.3", "NM_404.1"], cache=cache, offline=False, eutils_url=url)
+		assert {a: str(s) for a, s in found.items()} == CDS
+		assert StubEutils.requests == [["NM_000001.1", "NM_000002.3", "NM_404.1"]]
+		found = fetch_sequences(["NM_000002.3"], cache=cache, offline=False, eutils_url=url)
+		assert str(found["NM_000002.3"]) == CDS["NM_000002.3"] and len(StubEutils.requests) == 1
+		assert fetch_sequences(["NM_000001.1", "NM_404.1"], cache=cache, offline=True).keys() == {"NM_000001.1"}
+		assert len(StubEutils.requests) == 1
+		found = fetch_sequences(["NM_000002", "NM_000001.1"], cache=cache, offline=False, eutils_url=url)
+		assert {a: str(s) for a, s in found.items()} == {"NM_000002": CDS["NM_000002.3"], "NM_000001.1": CDS["NM_000001.1"]}
+		assert StubEutils.requests[1:] == [["NM_000002"]]
+		assert str(fetch_sequences(["NM_000002"], cache=cache, offline=True)["NM_000002"]) == CDS["NM_000002.3"]
+		assert len(StubEutils.requests) == 2
+	finally:
+		server.shutdown()
+		cache.close()
+
+def test_apply_mutations():
+	result = apply_mutations("ATGAAACCCTGA", ["c.4A>G", "c.6A>G", "c.4A>T", "c.12A>C", "c.2A>G", "c4A>G"])
+	assert result["protein_change"].tolist() == ["K2E", "K2K", "K2*", "*4C", "", ""]
+	assert result["consequence"].tolist() == ["missense", "synonymous", "nonsense", "stop_lost", "", ""]
+	assert result["ref_matches"].tolist() == [True, True, True, True, False, False]
+
+def test_apply_mutations_batch_offline(tmp_path):
+	cache = SequenceCache(str(tmp_path / "cache.sqlite"))
+	cache.put_many({a: ("", s) for a, s in CDS.items()})
+	mutations_df = pd.DataFrame({"transcript": ["NM_000001.1", "NM_000002.3", "NM_000001.1", "NM_404.1"],
+	                             "mutation": ["c.4G>A", "c.5A>G", "c.7T>C", "c.1A>G"]})
+	result = apply_mutations_batch(mutations_df, cache=cache, offline=True)
+	assert result[["transcript", "protein_change"]].values.tolist() == [["NM_000001.1", "A2T"], ["NM_000001.1", "*3Q"], ["NM_000002.3", "K2R"]]
+	cache.close()
@@ -0,0 +1,62 @@
+from io import StringIO
+from naive_variant_caller import *
+
+def test_batch_matches_call_variants():
+	for min_depth in [1, 5, 10, 20]:
+		assert call_variants_batch(test_pileup, test_ref, min_depth) == call_variants(test_pileup, test_ref, min_depth)
+
+def test_call_pileup_file_strips_markers():
+	pileup = "chr1\t1\tA\t4\t.,^]G$+2ACg\tIIII\nchr1\t2\tC\t0\t*\t*\n"
+	calls = pd.concat(call_pileup_file(StringIO(pileup), 2))
+	assert calls['CALL'].tolist() == ["G het", "nocall"]
+	assert calls['DP'].tolist() == [4, 0]
+
+def test_genotype_likelihoods_ignore_low_quality_bases():
+	pileup = ["GGGGGGGGGG", "....GGGGG#", "GGGGG....."]
+	quals = ["IIIIIIIIII", "IIIIIIIIII", "!!!!!IIIII"]
+	alt, gl = genotype_likelihoods(pileup, quals, "AAA")
+	gt, pl, gq, qual = genotype_from_likelihoods(gl)
+	assert [ALLELES[idx] for idx in alt] == ["G", "G", "G"]
+	assert [GENOTYPES[idx] for idx in gt] == [(1, 1), (0, 1), (0, 0)]
+	assert qual[0] > MIN_QUAL and qual[2] < MIN_QUAL
+
+def test_call_genome_writes_vcf(tmp_path):
+	fasta = tmp_path / "ref.fa"
+	fasta.write_text(">chr1\nACGT\n>chr2\nTTAA\n")
+	pileup = tmp_path / "sample.pileup"
+	pileup.write_text("chr2\t1\tT\t6\t..AA..\tIIIIII\n"
+					  "chr1\t1\tA\t6\tGGGGGG\tIIIIII\n"
+					  "chr1\t2\tC\t6\t......\tIIIIII\n"
+					  "chr1\t3\tG\t2\tTT\tII\n")
+	variants, throughput = call_genome(str(fasta), pileup=str(pileup))
+	assert throughput['POSITIONS'].sum() == 4
+	vcf = tmp_path / "calls.vcf"
+	VCFwriter().write_dataframe(variants, str(fasta), "S1", str(vcf))
+	with pysam.VariantFile(str(vcf)) as records:
+		calls = [(r.chrom, r.pos, r.ref, r.alts, r.samples["S1"]["GT"], list(r.filter)) for r in records]
+	assert calls == [("chr1", 1, "A", ("G",), (1, 1), ["PASS"]),
+					 ("chr2", 1, "T", ("A",), (0, 1), ["PASS"])]
+
+def test_call_genome_without_calls(tmp_path):
+	fasta = tmp_path / "ref.fa"
+	fasta.write_text(">chr1\nACGT\n")
+	pileup = tmp_path / "empty.pileup"
+	pileup.write_text("")
+	variants, throughput = call_genome(str(fasta), pileup=str(pileup))
+	assert variants.empty and list(variants.columns) == VCF_COLUMNS
+	assert throughput.empty
+
+def test_call_genome_tabix_pileup(tmp_path):
+	fasta = tmp_path / "ref.fa"
+	fasta.write_text(">chr1\nACGTACGTAC\n>chr2\nTTAA\n")
+	rows = "chr1\t1\tA\t6\tGGGGGG\tIIIIII\nchr1\t2\tC\t6\t......\tIIIIII\nchr1\t9\tA\t6\t..TT..\tIIIIII\n"
+	plain, indexed = tmp_path / "plain.pileup", tmp_path / "indexed.pileup"
+	plain.write_text(rows)
+	indexed.write_text(rows)
+	indexed = pysam.tabix_index(str(indexed), seq_col=0, start_col=1, end_col=1, zerobased=False)
+	# chr2 has no pileup rows and two regions per contig are cut from chr1
+	variants, throughput = call_genome(str(fasta), pileup=indexed, region_size=5, workers=2)
+	assert throughput[['CHROM', 'START', 'END', 'POSITIONS']].values.tolist() == [["chr1", 0, 5, 2], ["chr1", 5, 10, 1], ["chr2", 0, 4, 0]]
+	expected, _ = call_genome(str(fasta), pileup=str(plain))
+	assert variants.values.tolist() == expected.values.tolist()
+	assert variants[['#CHROM', 'POS', 'ALT']].values.tolist() == [["chr1", 1, "G"], ["chr1", 9, "T"]]
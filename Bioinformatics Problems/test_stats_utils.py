@@ -0,0 +1,16 @@
+import numpy as np
+from stats_utils import binom_interval, binom_intervals, sensitivity_stats_table, generate_analytical_sensitivity_stats
+
+def test_binom_intervals_match_scalar():
+	successes = np.array([0, 5, 10, 37, 5, 99])
+	totals = np.array([10, 10, 10, 50, 10, 100])
+	lower, upper = binom_intervals(successes, totals)
+	for k, n, lo, hi in zip(successes, totals, lower, upper):
+		assert (lo, hi) == binom_interval(int(k), int(n))
+
+def test_sensitivity_stats_table():
+	table = sensitivity_stats_table([8, 0], [10, 0], index=['SNV', 'INDEL'])
+	cols, row = generate_analytical_sensitivity_stats(8, 10)
+	assert list(table.columns) == cols
+	assert table.loc['SNV'].tolist() == row
+	assert table.loc['INDEL', 'N'] == 0 and np.isnan(table.loc['INDEL', 'Sensitivity'])
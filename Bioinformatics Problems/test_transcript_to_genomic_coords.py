@@ -0,0 +1,60 @@
+import pandas as pd
+from transcript_to_genomic_coords import *
+
+TRANSCRIPTS = "TR1\tCHR1\t3\t8M7D6M2I2M11D7M\nTR2\tCHR2\t10\t20M\n"
+QUERIES = "TR1\t4\nTR2\t0\nTR1\t13\nTR2\t10\nTR3\t1\nTR1\t25\n"
+EXPECTED = [("TR1", 4, "CHR1", 7), ("TR2", 0, "CHR2", 10), ("TR1", 13, "CHR1", 23),
+			("TR2", 10, "CHR2", 20), ("TR3", 1, "", -1), ("TR1", 25, "CHR1", -1)]
+
+def write_inputs(tmp_path):
+	transcripts_file, query_file = tmp_path / "transcripts.tsv", tmp_path / "queries.tsv"
+	transcripts_file.write_text(TRANSCRIPTS)
+	query_file.write_text(QUERIES)
+	return str(transcripts_file), str(query_file)
+
+def test_translate_df(tmp_path):
+	transcripts_file, query_file = write_inputs(tmp_path)
+	index = TranscriptIndex.from_file(transcripts_file)
+	queries = f_reader_df(query_file, cols=QUERY_COLUMNS)
+	translated = index.translate_df(queries)
+	assert list(translated[OUTPUT_COLUMNS].itertuples(index=False, name=None)) == EXPECTED
+	chromosomes, genomic_positions = index.translate(["TR2", "TR1"], [19, 8])
+	assert chromosomes.tolist() == ["CHR2", "CHR1"] and genomic_positions.tolist() == [29, 18]
+
+def test_query_chunks_stream_in_order(tmp_path):
+	transcripts_file, query_file = write_inputs(tmp_path)
+	assert [chunk.shape[0] for chunk in read_query_chunks(query_file, chunksize=4)] == [4, 2]
+	output = tmp_path / "output.tsv"
+	n_queries = translate_query_stream(TranscriptIndex.from_file(transcripts_file), query_file, str(output), chunksize=4)
+	assert n_queries == len(EXPECTED)
+	written = pd.read_csv(output, sep="\t", header=None, names=OUTPUT_COLUMNS, keep_default_na=False)
+	assert list(written.itertuples(index=False, name=None)) == EXPECTED
+
+def test_workers_keep_input_order(tmp_path):
+	transcripts_file, query_file = write_inputs(tmp_path)
+	output = tmp_path / "output.tsv"
+	translate_query_stream(TranscriptIndex.from_file(transcripts_file), query_file, str(output), chunksize=1, workers=3)
+	written = pd.read_csv(output, sep="\t", header=None, names=OUTPUT_COLUMNS, keep_default_na=False)
+	assert list(written.itertuples(index=False, name=None)) == EXPECTED
+
+def test_workers_read_a_bounded_number_of_chunks_ahead(tmp_path, monkeypatch):
+	transcripts_file, query_file = write_inputs(tmp_path)
+	query_file = tmp_path / "many_queries.tsv"
+	query_file.write_text(QUERIES*20)
+	import transcript_to_genomic_coords as module
+	read, ahead = [], []
+	def counting_chunks(*args, **kwargs):
+		for chunk in read_query_chunks(*args, **kwargs):
+			read.append(chunk.shape[0])
+			yield chunk
+	def recording_write(df, handle):
+		ahead.append(len(read) - len(ahead) - 1)
+		write_output_chunk(df, handle)
+	monkeypatch.setattr(module, "read_query_chunks", counting_chunks)
+	monkeypatch.setattr(module, "write_output_chunk", recording_write)
+	output = tmp_path / "output.tsv"
+	translate_query_stream(TranscriptIndex.from_file(transcripts_file), str(query_file), str(output), chunksize=1, workers=2)
+	assert len(read) == len(ahead) == len(EXPECTED)*20
+	assert max(ahead) <= 2*2
+	written = pd.read_csv(output, sep="\t", header=None, names=OUTPUT_COLUMNS, keep_default_na=False)
+	assert list(written.itertuples(index=False, name=None)) == EXPECTED*20
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import tsp
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mst-tsp", "data")
+
+def test_greedy_tour_r10():
+	nodes, D = tsp.load_graph(os.path.join(DATA, "r10.gexf"), cache=False)
+	tour, cost = tsp.greedy_tour(D, source=nodes.index("0"))
+	assert [nodes[i] for i in tour] == "0 6 7 3 4 1 5 2 8 9".split()
+	assert np.isclose(cost, 307.25236541847)
+
+def test_mst_heuristic_cache():
+	nodes, D = tsp.load_graph(os.path.join(DATA, "r15.gexf"), cache=False)
+	heuristic = tsp.MSTHeuristic(D, maxsize=4)
+	mask = tsp.nodes_mask([0, 3, 5, 14])
+	assert tsp.mask_nodes(mask, len(D)).tolist() == [0, 3, 5, 14]
+	assert heuristic(mask) == heuristic(mask) and heuristic.cost.cache_info().hits == 1
+
+def held_karp(D):
+	n = len(D)
+	best = {(1, 0): 0.0}
+	for mask in range(1, 1 << n, 2):
+		for last in range(n):
+			if (mask, last) not in best:
+				continue
+			for v in range(n):
+				if not mask & (1 << v):
+					key = (mask | (1 << v), v)
+					best[key] = min(best.get(key, np.inf), best[(mask, last)] + D[last, v])
+	return min(best[((1 << n) - 1, v)] + D[v, 0] for v in range(1, n))
+
+def test_astar_tour_optimal():
+	for name in ["r10.gexf", "r10em1.gexf"]:
+		nodes, D = tsp.load_graph(os.path.join(DATA, name), cache=False)
+		tour, cost, stats = tsp.astar_tour(D)
+		assert stats["optimal"] and sorted(tour) == list(range(10)) and tour[0] == 0
+		assert np.isclose(cost, tsp.tour_cost(D, tour)) and np.isclose(cost, held_karp(D))
+
+def test_astar_tour_state_limit():
+	nodes, D = tsp.load_graph(os.path.join(DATA, "r20.gexf"), cache=False)
+	greedy, greedy_cost = tsp.greedy_tour(D)
+	tour, cost, stats = tsp.astar_tour(D, upper_bound=(greedy, greedy_cost), max_states=50)
+	assert not stats["optimal"] and cost <= greedy_cost and np.isclose(cost, tsp.tour_cost(D, tour))
+
+def test_or_opt_best_move():
+	rng = np.random.default_rng(1)
+	points = rng.random((8, 2))
+	D = np.sqrt(((points[:, None] - points[None]) ** 2).sum(-1))
+	tour = [0, 5, 2, 7, 1, 3, 6, 4]
+	best = tsp.tour_cost(D, tour)
+	for length in range(1, 4):
+		for i in range(1, 9 - length):
+			segment, rest = tour[i:i + length], tour[:i] + tour[i + length:]
+			for k in range(1, len(rest) + 1):
+				for moved in (segment, segment[::-1]):
+					best = min(best, tsp.tour_cost(D, rest[:k] + moved + rest[k:]))
+	moved_tour, improved = tsp.or_opt(D, tour)
+	assert improved and moved_tour[0] == 0 and np.isclose(tsp.tour_cost(D, moved_tour), best)
+
+def test_multistart_tour():
+	nodes, D = tsp.load_graph(os.path.join(DATA, "r15.gexf"), cache=False)
+	tour, cost = tsp.multistart_tour(D, starts=8, workers=2)
+	assert tour[0] == 0 and sorted(tour) == list(range(15))
+	assert np.isclose(cost, tsp.astar_tour(D)[1])
+
+def test_load_graph_cache(tmp_path):
+	gexf = tmp_path / "g.gexf"
+	gexf.write_text('<?xml version="1.0" encoding="utf-8"?><gexf version="1.1" xmlns="http://www.gexf.net/1.1draft"><graph defaultedgetype="undirected">'
+	                '<nodes><node id="a" /><node id="b" /><node id="c" /></nodes>'
+	                '<edges><edge id="0" source="a" target="b" weight="2.5" /><edge id="1" source="b" target="c" /></edges></graph></gexf>')
+	nodes, D = tsp.load_graph(str(gexf))
+	assert nodes == ["a", "b", "c"] and D[0, 1] == D[1, 0] == 2.5 and D[2, 1] == 1.0 and np.isinf(D[0, 2])
+	assert (tmp_path / "g.gexf.npz").exists()
+	cached_nodes, cached_D = tsp.load_graph(str(gexf))
+	assert cached_nodes == nodes and np.array_equal(cached_D, D)
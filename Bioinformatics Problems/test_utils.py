@@ -0,0 +1,28 @@
+import logging
+import multiprocessing
+import os
+import utils
+from utils import setup_logger
+
+def test_setup_logger_attaches_handlers_once(tmp_path, monkeypatch, reset_logging):
+	monkeypatch.chdir(tmp_path)
+	logger = setup_logger("test_utils")
+	n_handlers = len(logger.handlers)
+	assert setup_logger("test_utils", debug=True) is logger and len(logger.handlers) == n_handlers
+	assert logger.isEnabledFor(logging.DEBUG)
+	logging.getLogger("test_utils").info("written once")
+	utils._listener.stop()
+	utils._listener.start()
+	with open(os.path.join("logs", "test_utils.log")) as log:
+		assert log.read().count("written once") == 1
+
+def test_imap_bounded_reads_ahead_at_most_max_pending():
+	read = []
+	def items():
+		for item in range(20):
+			read.append(item)
+			yield item
+	with multiprocessing.Pool(2) as pool:
+		for n_yielded, result in enumerate(utils.imap_bounded(pool, abs, items(), 3)):
+			assert result == n_yielded and len(read) <= n_yielded + 1 + 3
+	assert len(read) == 20
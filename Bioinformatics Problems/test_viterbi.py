@@ -0,0 +1,54 @@
+import itertools
+import numpy as np
+from viterbi import viterbi, log_tables, encode_sequence, decode, load_model, forward_backward, decode_batch
+
+def random_model(rng, N, symbols):
+	I = rng.random((1, N))
+	B = np.zeros((94, N))
+	B[:symbols] = rng.random((symbols, N))
+	A = rng.random((N, N))
+	return I/I.sum(), B/B.sum(axis=0), A/A.sum(axis=1, keepdims=True)
+
+def test_viterbi_matches_brute_force():
+	rng = np.random.default_rng(1)
+	I, B, A = random_model(rng, 3, 4)
+	seq = ["!", "#", "\"", "$", "!", "!"]
+	obs = encode_sequence(seq)
+	states, score = viterbi(obs, *log_tables(I, B, A))
+	def path_score(path):
+		return np.log10(I[0, path[0]]*B[obs[0], path[0]]) + sum(np.log10(A[a, b]*B[o, b]) for a, b, o in zip(path, path[1:], obs[1:]))
+	best = max(itertools.product(range(3), repeat=len(seq)), key=path_score)
+	assert states.tolist() == list(best)
+	assert np.isclose(score, path_score(best))
+
+def test_decode_impossible_symbols():
+	I, B, A = np.array([[1.0, 0.0]]), np.zeros((94, 2)), np.array([[0.0, 1.0], [1.0, 0.0]])
+	B[0, 0], B[1, 1] = 1.0, 1.0
+	assert decode("!\"!\"", I, B, A).tolist() == [0, 1, 0, 1]
+	posterior, log_likelihood = forward_backward(encode_sequence("!!"), I, B, A)
+	assert log_likelihood == -np.inf and np.isnan(posterior).all()
+	assert viterbi(encode_sequence("!!"), *log_tables(I, B, A))[1] == -np.inf
+
+def test_load_model(tmp_path):
+	model = tmp_path / "model"
+	model.write_text("2\nInitPr 2\n0 0.6\n1 0.4\nOutputPr 3\n0 ! 0.9\n0 \" 0.1\n1 \" 1.0\nTransPr 3\n0 0 0.7\n0 1 0.3\n1 0 1.0\n")
+	for _ in range(2):
+		I, B, A = load_model(str(model))
+		assert I.tolist() == [[0.6, 0.4]] and A.tolist() == [[0.7, 0.3], [1.0, 0.0]]
+		assert B[0].tolist() == [0.9, 0.0] and B[1].tolist() == [0.1, 1.0] and not B[2:].any()
+	assert (tmp_path / "model.npz").exists()
+
+def test_forward_backward_and_batch():
+	rng = np.random.default_rng(2)
+	I, B, A = random_model(rng, 2, 3)
+	seq = "!\"#!#"
+	obs = encode_sequence(seq)
+	posterior, log_likelihood = forward_backward(obs, I, B, A)
+	paths = list(itertools.product(range(2), repeat=len(seq)))
+	probability = [I[0, p[0]]*B[obs[0], p[0]]*np.prod([A[a, b]*B[o, b] for a, b, o in zip(p, p[1:], obs[1:])]) for p in paths]
+	assert np.isclose(log_likelihood, np.log10(sum(probability)))
+	expected = np.array([[sum(pr for p, pr in zip(paths, probability) if p[t] == s) for s in range(2)] for t in range(len(seq))])/sum(probability)
+	assert np.allclose(posterior, expected)
+	results = decode_batch([seq, seq[:3]], I, B, A, workers=2, posteriors=True)
+	assert results[0][0].tolist() == decode(seq, I, B, A).tolist() and np.allclose(results[0][2], posterior)
+	assert len(results[1][0]) == 3
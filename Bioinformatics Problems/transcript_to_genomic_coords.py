@@ -7,23 +7,25 @@ import glob
 import logging
 import ntpath
 import re
+import argparse
+import multiprocessing
+import numpy as np
 
 from cigar import CIGAR
+from utils import setup_logger, imap_bounded
 
 __author__ = 'Prateek Tandon'
 __email__  = 'prateektandon@alumni.cmu.edu'
 
-logger = logging.getLogger()
-handler = logging.StreamHandler()
-formatter = logging.Formatter(
-        '%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
 ## DONE Error handling for querying beyond CIGAR - Script returns -1
 ## DONE Error handling for querying unknown transcripts - Script returns -1 with empty string for Chromosome
 
+QUERY_COLUMNS = ['Transcript','Pos']
+OUTPUT_COLUMNS = ['Transcript','Pos','Chromosome','gPos']
+CHUNKSIZE = 1000000
+
 def create_cigar_obj_for_row(row):
     """Helper function that generates a CIGAR object for a row of the dataframe
 
@@ -37,41 +39,87 @@ def create_cigar_obj_for_row(row):
     cigar_string = row['Cigar']
     return CIGAR(cigar_string, start=start)
 
-def qpos_to_gpos(row):
-    """Helper method that processes a row of the query dataframe using a pre-processed row of the input transcript dataframe. 
+class TranscriptIndex(object):
+    def __init__(self, input_base_df):
+        """Index of the transcripts dataframe, built once: transcript id -> (chromosome, CIGAR).
+        If a transcript is listed more than once, its first row is used.
+
+        Args:
+            input_base_df (pandas.DataFrame): 4 column transcripts dataframe (Transcript, Chromosome, Pos, Cigar)
+        """
+        self.transcripts = {}
+        for transcript_id, chromosome, pos, cigar_string in input_base_df[['Transcript','Chromosome','Pos','Cigar']].itertuples(index=False, name=None):
+            if transcript_id not in self.transcripts:
+                self.transcripts[transcript_id] = (chromosome, CIGAR(cigar_string, start=int(pos)))
+        logger.debug("Indexed %d transcripts", len(self.transcripts))
+
+    @classmethod
+    def from_file(cls, input_base_file):
+        """Builds the index from the 4 column transcripts file"""
+        return cls(f_reader_df(input_base_file, cols=['Transcript','Chromosome','Pos','Cigar']))
+
+    def __contains__(self, transcript_id):
+        return transcript_id in self.transcripts
+
+    def get(self, transcript_id):
+        """(chromosome, CIGAR) of the transcript, None if it is unknown"""
+        return self.transcripts.get(transcript_id)
+
+    def translate(self, transcript_ids, positions):
+        """Translates transcript positions to genomic coordinates. Queries are grouped per
+        transcript so every transcript is looked up once and its positions are translated as one array.
+        Unknown transcripts get an empty chromosome and -1, as do positions beyond the CIGAR.
+
+        Args:
+            transcript_ids (array-like): Transcript of every query
+            positions (array-like): 0-based transcript position of every query
+
+        Returns:
+            tuple: (chromosomes, genomic_positions) arrays in the order of the queries
+        """
+        transcript_ids = pd.Series(transcript_ids).reset_index(drop=True)
+        positions = np.asarray(positions, dtype=np.int64)
+        chromosomes = np.full(positions.shape[0], "", dtype=object)
+        genomic_positions = np.full(positions.shape[0], -1, dtype=np.int64)
+        for transcript_id, rows in transcript_ids.groupby(transcript_ids, sort=False).indices.items():
+            entry = self.get(transcript_id)
+            if entry is None:
+                logger.warning(f"Did not find any transcripts by the name: {transcript_id}")
+                continue
+            chromosome, cigar_obj = entry
+            chromosomes[rows] = chromosome
+            genomic_positions[rows] = cigar_obj.query_to_ref_array(positions[rows])
+        return chromosomes, genomic_positions
+
+    def translate_df(self, input_q_df):
+        """Adds the Chromosome and gPos columns to a 2 column (Transcript, Pos) query dataframe"""
+        output_df = input_q_df.copy()
+        output_df['Chromosome'], output_df['gPos'] = self.translate(input_q_df['Transcript'], input_q_df['Pos'])
+        return output_df
+
+def qpos_to_gpos(row, transcript_index):
+    """Helper method that processes a row of the query dataframe using the transcript index.
     It uses prepopulated CIGAR object for generating genomic coordinates for the query position. 
     If the query position cannot be found with the transcript coordinates, returns -1
 
     Args:
         row (pandas.Series): A row of the 2 column input query dataframe
+        transcript_index (TranscriptIndex): Index built from the transcripts file
 
     Returns:
         integer : The genomic coordinate corresponding to the query position on the given transcript
     """
-    logger.debug(f"Currently processing row: {row}")
+    logger.debug("Currently processing row: %s", row)
     transcript_id = row['Transcript']
     qpos = row['Pos']
-    transcript_row = input_base_df.loc[input_base_df['Transcript'] == transcript_id]
-    if transcript_row.shape[0] > 0:
-        logger.debug("Successfully retrieved transcript info.")
-    else:
+    entry = transcript_index.get(transcript_id)
+    if entry is None:
         logger.warning(f"Did not find any transcripts by the name: {transcript_id}")
         return -1
-    cigar_obj = transcript_row['cigar_obj'].iloc[0]
-    curr = cigar_obj.start
-    curt = 0
-    for idx, item in enumerate(cigar_obj.cigar_scorer):
-        # Use the scoring matrix from the CIGAR object to advance/not advance the position on ref/transcript
-        # per the CIGAR op one by one
-        transcript_score = item[0]
-        ref_score = item[1]
-        logger.debug(f"Current ref position: {curr}, current transcript position: {curt}")
-        if curt == qpos:
-            logger.debug(f"For transcript position {curt}, the corresponding genomic position is: {curr}")
-            return curr
-        curr = curr+ref_score
-        curt = curt+transcript_score
-    return -1
+    cigar_obj = entry[1]
+    gpos = cigar_obj.query_to_ref(qpos)
+    logger.debug("For transcript position %s, the corresponding genomic position is: %s", qpos, gpos)
+    return gpos
 
 def f_reader_df(input_fname, cols=None):
     """File reader function to isolate each component of the task
@@ -85,13 +133,96 @@ def f_reader_df(input_fname, cols=None):
     """
     df = pd.DataFrame()
     try:
-        df = pd.read_csv(input_fname, sep="\t", header=None)
+        df = pd.read_csv(input_fname, sep="\t", header=None, dtype={0: str})
     except:
         logger.error("A problem occurred while reading the file into a dataframe.")
     if cols:
         df.columns = cols
     return df
 
+def read_query_chunks(input_q_file, chunksize=CHUNKSIZE):
+    """Reads the 2 column query file in chunks so that it never has to fit in memory.
+
+    Args:
+        input_q_file (string): Path to the query file, "-" for stdin
+        chunksize (int, optional): Number of queries per chunk. Defaults to CHUNKSIZE.
+
+    Yields:
+        pandas.DataFrame: Chunk of the query file with the Transcript and Pos columns
+    """
+    source = sys.stdin if input_q_file == '-' else input_q_file
+    yield from pd.read_csv(source, sep="\t", header=None, names=QUERY_COLUMNS, usecols=[0, 1],
+                           dtype={'Transcript': str}, chunksize=chunksize)
+
+def write_output_chunk(df, handle):
+    """Writes translated queries to an open handle in the output file format
+    (No header, No column names, integer positions)
+
+    Args:
+        df (pandas.DataFrame): Translated queries with the OUTPUT_COLUMNS
+        handle (file): Output handle, opened for text writing
+    """
+    output_df = df[OUTPUT_COLUMNS].copy()
+    output_df['Pos']  = output_df['Pos'].astype(int)
+    output_df['gPos'] = output_df['gPos'].astype(int)
+    output_df.to_csv(handle, sep="\t", index=False, header=None)
+
+## Index of the worker processes, set once per worker by _init_worker
+_worker_index = None
+
+def _init_worker(transcript_index):
+    """Pool initializer: keeps the transcript index in the worker. Under fork the workers inherit it
+    from the parent without pickling; otherwise it is pickled once per worker, never per chunk."""
+    global _worker_index
+    _worker_index = transcript_index
+
+def _translate_chunk(chunk):
+    """Pool task: translates one chunk of queries with the worker's index"""
+    return _worker_index.translate_df(chunk)
+
+def translate_query_stream(transcript_index, input_q_file, output_fname, chunksize=CHUNKSIZE, workers=1):
+    """Streams the query file through the transcript index chunk by chunk, appending every
+    translated chunk to the output as soon as it is ready. Memory use is bounded by the chunk size.
+    With workers > 1 the chunks are translated on a process pool and written back in input order,
+    reading at most two chunks per worker ahead of the output so memory stays bounded by the chunk size.
+
+    Args:
+        transcript_index (TranscriptIndex): Index built from the transcripts file
+        input_q_file (string): Path to the query file, "-" for stdin
+        output_fname (string): Output path, "-" for stdout
+        chunksize (int, optional): Number of queries per chunk. Defaults to CHUNKSIZE.
+        workers (int, optional): Number of worker processes. Defaults to 1.
+
+    Returns:
+        int: Number of queries translated
+    """
+    n_queries = 0
+    chunks = read_query_chunks(input_q_file, chunksize=chunksize)
+    pool = None
+    handle = None
+    try:
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(transcript_index,))
+            translated_chunks = imap_bounded(pool, _translate_chunk, chunks, workers*2)
+        else:
+            translated_chunks = map(transcript_index.translate_df, chunks)
+        handle = sys.stdout if output_fname == '-' else open(output_fname, 'w')
+        for translated in translated_chunks:
+            write_output_chunk(translated, handle)
+            handle.flush()
+            n_queries += translated.shape[0]
+            logger.debug("Translated %d queries", n_queries)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if handle is not None and handle is not sys.stdout:
+            handle.close()
+        if pool is not None:
+            # a no-op after a clean close/join, stops the workers if a chunk failed
+            pool.terminate()
+    return n_queries
+
 def generate_output_file(df, output_fname='output.txt'):
     """Helper function to help write the output dataframe to a file. 
     Encapsulates the formatting of the output file per the requirement. 
@@ -101,55 +232,45 @@ def generate_output_file(df, output_fname='output.txt'):
         df (pandas.DataFrame): Output dataframe to be written to a file.
         output_fname (str, optional): Output filename. Defaults to 'output.txt'.
     """
-    output_df = df
-    output_df['Pos']  = output_df['Pos'].astype(int)
-    output_df['gPos'] = output_df['gPos'].astype(int)
     try:
-        df.to_csv(output_fname, sep="\t", index=False, header=None)
+        with open(output_fname, 'w') as handle:
+            write_output_chunk(df, handle)
     except:
         logger.error("Data generation successful but a problem occurred while writing results to file.")
         sys.exit(1)
     logger.info(f"Output file: {output_fname} was created successfully.")
 
-def check_args(num_args=3):
-    """Helper function to check whether valid number of arguments have been passed to the script.
-    Modularized to take in changes to requirements if they come in the future.
-
-    Args:
-        num_args (int, optional): Number of arguments to use for validation. Defaults to 3.
-    """
-    if len(sys.argv) != num_args:
-        logger.error("Usage: python transcript_to_genomic_coords.py <TRANSCRIPTS_FILE> <QUERY_FILE>")
-        logger.error(f"Received: {len(sys.argv[1:])} arguments instead. Exiting!")
-        sys.exit(1)
-    logger.debug(f"Verified number of arguments passed == {num_args}")
-
-def get_chromosome(row):
+def get_chromosome(row, transcript_index):
     """Gets the chromosome that the transcript resides on. If not found, returns empty string. 
 
     Args:
         row (pandas.Series): Row of input 2 column query dataframe
+        transcript_index (TranscriptIndex): Index built from the transcripts file
 
     Returns:
         str: Chromosome that the transcript corresponds to. If not found, returns empty string.
     """
-    transcript_rows = input_base_df[input_base_df['Transcript'] == row['Transcript']]
-    if transcript_rows.shape[0] > 0:
-        return transcript_rows['Chromosome'].tolist()[0]
+    entry = transcript_index.get(row['Transcript'])
+    if entry is not None:
+        return entry[0]
     return ""
 
 def main():
-    check_args(num_args=3)
-    global input_base_df
-    input_base_file            = sys.argv[1]
-    input_q_file               = sys.argv[2]
-    output_fname               = "output_from_script.txt"
-    input_base_df              = f_reader_df(input_base_file,cols=['Transcript','Chromosome','Pos','Cigar'])
-    input_q_df                 = f_reader_df(input_q_file   ,cols=['Transcript','Pos'])
-    input_base_df['cigar_obj'] = input_base_df.apply(lambda x: create_cigar_obj_for_row(x), axis=1)
-    input_q_df['Chromosome']   = input_q_df.apply(get_chromosome, axis =1)
-    input_q_df['gPos']         = input_q_df.apply(qpos_to_gpos, axis=1)
-    generate_output_file(input_q_df, output_fname=output_fname)
+    parser = argparse.ArgumentParser(description="Translate transcript coordinates to genomic coordinates")
+    parser.add_argument("transcripts_file", help="4 column transcripts file (Transcript, Chromosome, Pos, Cigar)")
+    parser.add_argument("query_file", help="2 column query file (Transcript, Pos), - for stdin")
+    parser.add_argument("-o", "--output", default="output_from_script.txt", help="Output file, - for stdout")
+    parser.add_argument("-c", "--chunksize", type=int, default=CHUNKSIZE, help="Queries read and translated per chunk")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes translating chunks in parallel")
+    args = parser.parse_args()
+    setup_logger()
+    transcript_index           = TranscriptIndex.from_file(args.transcripts_file)
+    try:
+        n_queries              = translate_query_stream(transcript_index, args.query_file, args.output,
+                                                        chunksize=args.chunksize, workers=args.workers)
+    except BrokenPipeError:
+        sys.exit(1)
+    logger.info(f"Translated {n_queries} queries into {'stdout' if args.output == '-' else args.output}")
 
 if __name__ == '__main__':
     main()
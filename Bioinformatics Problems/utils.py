@@ -1,5 +1,9 @@
 # utils and such
+import atexit
+import collections
 import logging
+import logging.handlers
+import queue
 import sys
 import pandas as pd
 import sys
@@ -12,7 +16,47 @@ from os.path import isfile
 from functools import partial
 from functools import reduce
 
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# The one QueueListener of the process and the log files it already writes to
+_listener = None
+_log_files = set()
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that falls back to writing synchronously in forked worker processes, where the
+    listener thread of the parent does not exist"""
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.pid = os.getpid()
+
+    def emit(self, record):
+        if os.getpid() == self.pid:
+            super().emit(record)
+        else:
+            for handler in _listener.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 def setup_logger(log_file=None, debug=False):
+    """Configures the root logger once for the whole process: records go through a QueueHandler to a
+    QueueListener thread that does the actual (stream and file) writing, so logging calls never wait on
+    I/O. Later calls only change the level and add the log file if it is not written to yet, so handlers
+    are never duplicated. Debug messages should be logged with %-style arguments (logger.debug("x %s", x))
+    so they are only formatted when debug logging is on.
+
+    Arguments:
+        log_file {str} -- Also write to logs/<log_file>.log in the current directory (default: {None})
+        debug {bool} -- Log debug messages (default: {False})
+
+    Returns:
+        logging.Logger -- The root logger
+    """
+    global _listener
     logger = logging.getLogger()
     logger.propagate = False
     if debug:
@@ -21,22 +65,48 @@ def setup_logger(log_file=None, debug=False):
         logger.setLevel(logging.INFO)
 
     # handlers
-    if not logger.handlers:
+    if _listener is None:
         st_handler = logging.StreamHandler()
-        log_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        st_handler.setFormatter(log_format)
-        logger.addHandler(st_handler)
+        st_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, st_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)
+        logger.addHandler(_QueueHandler(log_queue))
 
-    # optional logging to file                                                                                                                                                                                                              
-    if log_file:
+    # optional logging to file
+    if log_file and log_file not in _log_files:
         cwd = os.getcwd()
         mkdir(os.path.join(cwd,'logs'))
         f_handler = logging.FileHandler(os.path.join(cwd, 'logs',log_file+".log"))
-        log_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        f_handler.setFormatter(log_format)
-        logger.addHandler(f_handler)
+        f_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        _listener.handlers = _listener.handlers + (f_handler,)
+        _log_files.add(log_file)
     return logger
 
+def imap_bounded(pool, func, iterable, max_pending):
+    """[Ordered Pool.imap that only reads ahead of the results by max_pending items. Pool.imap hands the
+    whole iterable to its task feeder at once, so a chunk generator would be read to the end up front;
+    here every item is submitted with apply_async and the next one is only read once the oldest result
+    has been taken, keeping memory bounded by max_pending chunks]
+
+    Arguments:
+        pool {[multiprocessing.Pool]} -- [Pool to run func on]
+        func {[callable]} -- [Picklable function of one item]
+        iterable {[iterable]} -- [Items, read lazily]
+        max_pending {[int]} -- [Most items submitted but not yet yielded]
+
+    Yields:
+        [object] -- [func(item) for every item, in input order]
+    """
+    pending = collections.deque()
+    for item in iterable:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
 def factors(n):    
     return set(reduce(list.__add__, 
                 ([i, n//i] for i in range(1, int(n**0.5) + 1) if n % i == 0)))
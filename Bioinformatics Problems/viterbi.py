@@ -1,78 +1,208 @@
-import math
+import os
+import argparse
+import multiprocessing
 import numpy as np
-def decode(seqFile, I, B, A):
-    T = len(seqFile)
-    VP = np.zeros((N,T), dtype=float)
-    char_init = seqFile[0]
-    cInd = ord(char_init)-ord(baseChar)
-    for i in range(N):
-        if (B[cInd][i] > 0 and I[0][i] != 0):   VP[i][0] = math.log10(I[0][i]) + math.log10(B[cInd][i])
-        else:   VP[i][0] = -10000000.0
-    timestep = []
-    ind_mat = []
-    print "VP initialized "
-    print VP
-    for t in range(1,T):        #For each word in the sequence/ or the timestep
-        for i in range(N):
-            for j in range(N):
-                cIndex = ord(seqFile[t])-ord(baseChar)
-                prev_state = VP[j][t-1]
-                trans = A[j][i]
-                print "JI", j,i
-                if B[cIndex][i] > 0 and prev_state > -50000 and trans > 0:
-                    calc = prev_state+math.log10(trans)+math.log10(B[cIndex][i])
-                else:   calc = -10000000.000000000000
-                timestep.append(calc)
-        print "Timestep", t , "the values are", timestep
-        VP[0][t] = max(timestep[0],timestep[1])
-        VP[1][t] = max(timestep[2],timestep[3])
-        timestep = []
-    for t in range(T):     
-        if VP[0][t] <= VP[1][t]:    ind_mat.append((1,t))
-        else:   ind_mat.append((0,t))
-    ind_mat.sort(key=lambda tup: tup[1])
-    states = [x[0] for x in ind_mat]
-    result = zip(seqFile,states)
-    for (x,y) in result:     print x,y    
 
-if __name__ == '__main__':
-    f = open("samplemod2")
-    g = open("sampleseq2")
-    r = f.read().splitlines()
-    seqFile = g.read().splitlines()
+BASE_CHAR = '!'
+SYMNUM = 94
+
+def encode_sequence(seqFile, baseChar=BASE_CHAR):
+    """Symbol indices (row of B) of a sequence given as a string or as a list of one symbol lines"""
+    return np.frombuffer("".join(seqFile).encode(), dtype=np.uint8).astype(np.int64) - ord(baseChar)
+
+def log_tables(I, B, A):
+    """log10 of the initial, output and transition probabilities, computed once per model.
+    Zero probabilities become -inf, so impossible paths can never win a max."""
+    with np.errstate(divide='ignore'):
+        return np.log10(np.asarray(I, dtype=float).ravel()), np.log10(np.asarray(B, dtype=float)), np.log10(np.asarray(A, dtype=float))
+
+def viterbi(obs, logI, logB, logA):
+    """Viterbi decoding in log space for any number of states N. Every time step is one (N x N)
+    broadcast of the previous scores over the transition table, whose max gives the new scores and
+    whose argmax is stored as the backpointer of that step; the state path is then traced back from
+    the best final state.
+
+    Args:
+        obs (np.ndarray): Symbol indices, see encode_sequence
+        logI (np.ndarray): (N,) log initial probabilities
+        logB (np.ndarray): (SYMNUM, N) log output probabilities
+        logA (np.ndarray): (N, N) log transition probabilities, from state on the rows
+
+    Returns:
+        tuple: (states, log10 probability of the best path), -inf if the sequence is impossible
+    """
+    T, N = len(obs), logA.shape[0]
+    if T == 0:
+        return np.zeros(0, dtype=np.int64), 0.0
+    emissions = logB[obs]
+    backpointers = np.empty((T, N), dtype=np.min_scalar_type(N - 1))
+    scores = logI + emissions[0]
+    candidates = np.empty((N, N))
+    for t in range(1, T):
+        np.add(scores[:, None], logA, out=candidates)
+        best = candidates.argmax(axis=0)
+        backpointers[t] = best
+        scores = candidates[best, np.arange(N)] + emissions[t]
+    states = np.empty(T, dtype=np.int64)
+    states[-1] = scores.argmax()
+    for t in range(T - 1, 0, -1):
+        states[t - 1] = backpointers[t, states[t]]
+    return states, float(scores[states[-1]])
+
+def decode(seqFile, I, B, A, baseChar=BASE_CHAR):
+    """Most likely state of every symbol of the sequence (see viterbi)
+
+    Returns:
+        np.ndarray: State per symbol
+    """
+    states, log_probability = viterbi(encode_sequence(seqFile, baseChar), *log_tables(I, B, A))
+    return states
+
+def read_model(model_file, baseChar=BASE_CHAR):
+    """Parses the N / InitPr / OutputPr / TransPr model file in a single pass over its lines. Every
+    section header gives the number of lines that follow it; their values are collected and written
+    into the arrays with one fancy-indexed assignment per section.
+
+    Returns:
+        tuple: (I, B, A) probability arrays of shapes (1, N), (SYMNUM, N) and (N, N)
+    """
+    with open(model_file) as f:
+        r = f.read().splitlines()
     N = int(r[0])
-    baseChar = '!'
-    SYMNUM = 94
+    sections = {}
+    line = 1
+    while line < len(r):
+        fields = r[line].split(' ')
+        if fields[0] in ("InitPr", "OutputPr", "TransPr"):
+            count = int(fields[1])
+            sections[fields[0]] = [entry.split(' ') for entry in r[line+1:line+1+count]]
+            line += count
+        line += 1
     I = np.zeros((1,N))
     B = np.zeros((SYMNUM,N))
     A = np.zeros((N,N))
-    for keywrd in r:
-        if keywrd.startswith("InitPr"):
-            ind = r.index(keywrd)
-            ind_parse = r[ind].split(' ')
-            count = int(ind_parse[1])
-            st_ind = ind+1
-            for line in xrange(st_ind, st_ind+count):
-                index = int(r[line].split(" ")[0])
-                val = float(r[line].split(" ")[1])
-                I[0][index] = val
-        if keywrd.startswith("OutputPr"):
-            ind = r.index(keywrd)
-            ind_parse = r[ind].split(' ')
-            count = int(ind_parse[1])
-            st_ind = ind+1
-            for line in xrange(st_ind, st_ind+count):
-                (s,sym,pr) = r[line].split(" ")
-                s = int(s)
-                pr = float(pr)
-                calc = ord(sym)-ord(baseChar)
-                B[calc][s] = pr
-        if keywrd.startswith("TransPr"):
-            ind = r.index(keywrd)
-            ind_parse = r[ind].split(' ')
-            count = int(ind_parse[1])
-            st_ind = ind+1
-            for line in xrange(st_ind, st_ind+count):
-                (s,s1,pr) = r[line].split(" ")
-                A[int(s)][int(s1)]=float(pr)
-    decode(seqFile,I, B, A)
+    if sections.get("InitPr"):
+        index, val = zip(*sections["InitPr"])
+        I[0, np.array(index, dtype=int)] = np.array(val, dtype=float)
+    if sections.get("OutputPr"):
+        s, sym, pr = zip(*sections["OutputPr"])
+        B[encode_sequence(sym, baseChar), np.array(s, dtype=int)] = np.array(pr, dtype=float)
+    if sections.get("TransPr"):
+        s, s1, pr = zip(*sections["TransPr"])
+        A[np.array(s, dtype=int), np.array(s1, dtype=int)] = np.array(pr, dtype=float)
+    return I, B, A
+
+def load_model(model_file, baseChar=BASE_CHAR, cache=True):
+    """read_model with a binary cache: the arrays are saved next to the model as <model_file>.npz and
+    read back from there while the model file's mtime is unchanged
+
+    Returns:
+        tuple: (I, B, A), see read_model
+    """
+    cache_file = model_file + ".npz"
+    mtime = os.path.getmtime(model_file)
+    if cache and os.path.exists(cache_file):
+        with np.load(cache_file) as cached:
+            if cached["mtime"] == mtime and str(cached["baseChar"]) == baseChar:
+                return cached["I"], cached["B"], cached["A"]
+    I, B, A = read_model(model_file, baseChar)
+    if cache:
+        with open(cache_file, "wb") as f:
+            np.savez(f, I=I, B=B, A=A, mtime=mtime, baseChar=baseChar)
+    return I, B, A
+
+def forward_backward(obs, I, B, A):
+    """Posterior state probabilities by the scaled forward-backward algorithm. Forward and backward
+    variables are renormalized at every step (vector-matrix products over the N states), so
+    sequences of any length stay inside floating point range.
+
+    Args:
+        obs (np.ndarray): Symbol indices, see encode_sequence
+        I, B, A (np.ndarray): Model probabilities, see read_model
+
+    Returns:
+        tuple: ((T, N) posterior probability of every state at every step, log10 likelihood of the sequence).
+        A sequence the model cannot produce has a log10 likelihood of -inf and NaN posteriors.
+    """
+    T, N = len(obs), A.shape[0]
+    if T == 0:
+        return np.zeros((0, N)), 0.0
+    emissions = np.asarray(B, dtype=float)[obs]
+    A = np.asarray(A, dtype=float)
+    alpha = np.empty((T, N))
+    scale = np.empty(T)
+    for t in range(T):
+        alpha[t] = (alpha[t-1] @ A if t else np.asarray(I, dtype=float).ravel())*emissions[t]
+        scale[t] = alpha[t].sum()
+        if scale[t] == 0:
+            # no path reaches step t, the posteriors are undefined
+            return np.full((T, N), np.nan), -np.inf
+        alpha[t] /= scale[t]
+    beta = np.empty((T, N))
+    beta[-1] = 1.0
+    for t in range(T - 2, -1, -1):
+        beta[t] = A @ (emissions[t+1]*beta[t+1])/scale[t+1]
+    posterior = alpha*beta
+    posterior /= posterior.sum(axis=1, keepdims=True)
+    return posterior, float(np.log10(scale).sum())
+
+## Model of the worker processes, set once per worker by _init_worker
+_worker_model = None
+
+def _init_worker(I, B, A):
+    """Pool initializer: keeps the model and its log tables in the worker instead of pickling them per sequence"""
+    global _worker_model
+    _worker_model = (I, B, A, log_tables(I, B, A))
+
+def _decode_task(task):
+    """Pool task: Viterbi path (and posteriors if asked) of one encoded sequence"""
+    obs, posteriors = task
+    I, B, A, tables = _worker_model
+    states, log_probability = viterbi(obs, *tables)
+    return states, log_probability, forward_backward(obs, I, B, A)[0] if posteriors else None
+
+def decode_batch(sequences, I, B, A, baseChar=BASE_CHAR, workers=1, posteriors=False):
+    """Decodes many sequences against the same model, on a process pool when workers > 1. The model
+    is sent to every worker once and the results come back in input order.
+
+    Args:
+        sequences (list): Sequences as strings or lists of one symbol lines
+        I, B, A (np.ndarray): Model probabilities, see load_model
+        workers (int, optional): Worker processes. Defaults to 1.
+        posteriors (bool, optional): Also compute forward_backward posteriors. Defaults to False.
+
+    Returns:
+        list: (states, log10 path probability, posteriors or None) per sequence
+    """
+    tasks = [(encode_sequence(seq, baseChar), posteriors) for seq in sequences]
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(I, B, A)) as pool:
+            return pool.map(_decode_task, tasks)
+    _init_worker(I, B, A)
+    return list(map(_decode_task, tasks))
+
+def main():
+    parser = argparse.ArgumentParser(description="Viterbi decoding of symbol sequences (one symbol per line) with an HMM")
+    parser.add_argument("model_file", nargs="?", default="samplemod2", help="N / InitPr / OutputPr / TransPr model file")
+    parser.add_argument("seq_files", nargs="*", default=["sampleseq2"], help="Sequence files")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("-p", "--posteriors", action="store_true", help="Also print the posterior probability of every state")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary model cache")
+    args = parser.parse_args()
+    I, B, A = load_model(args.model_file, cache=not args.no_cache)
+    sequences = []
+    for seq_file in args.seq_files:
+        with open(seq_file) as g:
+            sequences.append(g.read().splitlines())
+    results = decode_batch(sequences, I, B, A, workers=args.workers, posteriors=args.posteriors)
+    for seq_file, seqFile, (states, log_probability, posterior) in zip(args.seq_files, sequences, results):
+        if len(args.seq_files) > 1:
+            print("# {f} log10 P = {p}".format(f=seq_file, p=log_probability))
+        for t, (x,y) in enumerate(zip(seqFile, states.tolist())):
+            if args.posteriors:
+                print(x, y, " ".join("{:.4f}".format(value) for value in posterior[t]))
+            else:
+                print(x,y)
+
+if __name__ == '__main__':
+    main()